@@ -0,0 +1,388 @@
+"""
+Concurrent booking benchmark for the ticket booking endpoint.
+
+Creates a throwaway test database, seeds one event per run and lets many
+bookers race for its seats through TicketCreateView, from a pool of threads
+and from a pool of processes. Every request opens its own database
+connection, as a server without persistent connections would. A run
+reports throughput, p50/p99 latency, the outcome of every booking, lock
+waits and whether the event was oversold.
+
+Against SQLite, with the database settings of .env.dev overridden:
+
+    SQL_ENGINE=django.db.backends.sqlite3 SQL_DATABASE=bench.sqlite3 \\
+        python benchmarks/booking_load.py --bookers 500 --max-seats 100
+
+Against the PostgreSQL of docker-compose, from the web container:
+
+    docker-compose run --rm web python benchmarks/booking_load.py \\
+        --bookers 500 --max-seats 100 --output reports/after.json \\
+        --baseline reports/before.json
+
+Lock waits are sampled from pg_locks on PostgreSQL. SQLite has a single
+writer and no lock table, there lock waits show up as bookings that fail
+with "database is locked" once the busy timeout runs out. The report is
+JSON, --baseline compares a run with an earlier report. The exit status
+is 1 when a run oversold its event.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import OperationalError, connection  # noqa: E402
+from django.db.models import Sum  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.exceptions import ValidationError  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from event.models import Event, EventStats, Ticket  # noqa: E402
+from event.views import booking_outcome  # noqa: E402
+from users.authentication import UserRefreshToken  # noqa: E402
+
+User = get_user_model()
+
+# Backends of this database waiting for a lock held by another one
+WAITING_SQL = """
+    SELECT count(DISTINCT l.pid)
+    FROM pg_locks l JOIN pg_stat_activity a ON a.pid = l.pid
+    WHERE NOT l.granted AND a.datname = current_database()
+"""
+
+
+def use_database(name):
+    # Points the worker processes at the test database of the parent
+    settings.DATABASES["default"]["NAME"] = name
+    settings.DEBUG = False
+
+
+def warm_up(_):
+    # Occupies a worker for a moment so every worker of the pool is started
+    # and imported before the clock starts
+    connection.ensure_connection()
+    connection.close()
+    time.sleep(0.2)
+
+
+def book(task):
+    token, event_id, quantity = task
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+    started = time.perf_counter()
+    try:
+        response = client.post(
+            reverse("ticket-create"),
+            {"event": event_id, "quantity": quantity},
+            format="json",
+        )
+    except OperationalError as exc:
+        outcome = "database_locked" if "locked" in str(exc) else "database_error"
+    else:
+        if response.status_code == 201:
+            outcome = "success"
+        elif response.status_code == 202:
+            outcome = "queued"
+        elif response.status_code == 400:
+            outcome = booking_outcome(ValidationError(response.data))
+        else:
+            outcome = f"http_{response.status_code}"
+    latency = time.perf_counter() - started
+    connection.close()
+    return latency, outcome
+
+
+class LockSampler(threading.Thread):
+    # Counts the backends waiting for a lock every interval seconds
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            with connection.cursor() as cursor:
+                while not self.stopped.is_set():
+                    cursor.execute(WAITING_SQL)
+                    self.samples.append(cursor.fetchone()[0])
+                    self.stopped.wait(self.interval)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        waiting = [count for count in self.samples if count]
+        return {
+            "source": "pg_locks",
+            "samples": len(self.samples),
+            "samples_waiting": len(waiting),
+            "max_waiting": max(self.samples, default=0),
+            "mean_waiting": (
+                round(statistics.fmean(self.samples), 2) if self.samples else 0
+            ),
+            # Backend seconds spent waiting, as far as the sampling saw
+            "estimated_wait_s": round(sum(waiting) * self.interval, 3),
+        }
+
+
+def create_bookers(count):
+    users = User.objects.bulk_create(
+        User(username=f"booker{i}", user_type="user") for i in range(count)
+    )
+    return [str(UserRefreshToken.for_user(user).access_token) for user in users]
+
+
+def create_event(args, created_by):
+    now = timezone.now()
+    return Event.objects.create(
+        title="Booking benchmark",
+        description="Seeded by benchmarks/booking_load.py",
+        location="Hall",
+        start_time=now + timezone.timedelta(days=2),
+        end_time=now + timezone.timedelta(days=2, hours=2),
+        max_seats=args.max_seats,
+        max_tickets_per_user=args.max_tickets_per_user,
+        ticket_cost=10,
+        booking_start=now - timezone.timedelta(hours=1),
+        booking_end=now + timezone.timedelta(days=1),
+        created_by=created_by,
+    )
+
+
+def check_event(event, successes, quantity):
+    # Everything that a correct booking path never lets happen
+    event.refresh_from_db()
+    tickets = Ticket.objects.filter(event=event)
+    sold = tickets.aggregate(total=Sum("quantity"))["total"] or 0
+    over_limit = (
+        tickets.values("user")
+        .annotate(total=Sum("quantity"))
+        .filter(total__gt=event.max_tickets_per_user)
+        .count()
+    )
+    stats = EventStats.objects.filter(event=event).first()
+
+    violations = []
+    if event.booked_seats > event.max_seats:
+        violations.append(
+            f"booked_seats {event.booked_seats} exceeds max_seats {event.max_seats}"
+        )
+    if sold > event.max_seats:
+        violations.append(f"{sold} tickets sold for {event.max_seats} seats")
+    if sold != event.booked_seats:
+        violations.append(
+            f"{sold} tickets sold but booked_seats is {event.booked_seats}"
+        )
+    if sold != successes * quantity:
+        violations.append(f"{sold} tickets sold by {successes} successful bookings")
+    if over_limit:
+        violations.append(f"{over_limit} users over max_tickets_per_user")
+    if stats and stats.tickets_booked != sold:
+        violations.append(
+            f"stats count {stats.tickets_booked} tickets, {sold} were sold"
+        )
+    return {
+        "max_seats": event.max_seats,
+        "booked_seats": event.booked_seats,
+        "tickets_sold": sold,
+        "violations": violations,
+    }
+
+
+def run(mode, args, tokens, created_by):
+    event = create_event(args, created_by)
+    tasks = [
+        (tokens[i % len(tokens)], event.pk, args.quantity) for i in range(args.bookers)
+    ]
+    if mode == "threads":
+        pool = ThreadPoolExecutor(args.concurrency)
+    else:
+        pool = ProcessPoolExecutor(
+            args.concurrency,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=use_database,
+            initargs=(settings.DATABASES["default"]["NAME"],),
+        )
+    # The parent's connection mustn't hold locks or be shared while booking
+    connection.close()
+
+    sampler = None
+    if connection.vendor == "postgresql":
+        sampler = LockSampler(args.sample_interval)
+    with pool:
+        list(pool.map(warm_up, range(args.concurrency)))
+        if sampler:
+            sampler.start()
+        started = time.perf_counter()
+        results = list(pool.map(book, tasks))
+        elapsed = time.perf_counter() - started
+
+    outcomes = {}
+    for _, outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    if sampler:
+        lock_waits = sampler.stop()
+    else:
+        lock_waits = {
+            "source": "database is locked errors",
+            "errors": outcomes.get("database_locked", 0),
+        }
+
+    latencies = sorted(latency for latency, _ in results)
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "mode": mode,
+        "bookers": args.bookers,
+        "users": len(tokens),
+        "concurrency": args.concurrency,
+        "quantity": args.quantity,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(results) / elapsed, 1),
+        "bookings_per_s": round(outcomes.get("success", 0) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentiles[49] * 1000, 1),
+            "p99": round(percentiles[98] * 1000, 1),
+            "max": round(latencies[-1] * 1000, 1),
+        },
+        "outcomes": outcomes,
+        "lock_waits": lock_waits,
+        "seats": check_event(event, outcomes.get("success", 0), args.quantity),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    before = {}
+    if baseline:
+        before = {run["mode"]: run for run in baseline["runs"]}
+    print(
+        f"{'mode':<10}{'req/s':>9}{'book/s':>9}{'p50 ms':>9}{'p99 ms':>9}"
+        f"{'sold':>7}{'locks':>8}  outcomes"
+    )
+    for run in report["runs"]:
+        locks = run["lock_waits"].get(
+            "estimated_wait_s", run["lock_waits"].get("errors")
+        )
+        print(
+            f"{run['mode']:<10}{run['requests_per_s']:>9}{run['bookings_per_s']:>9}"
+            f"{run['latency_ms']['p50']:>9}{run['latency_ms']['p99']:>9}"
+            f"{run['seats']['tickets_sold']:>7}{locks:>8}  "
+            + ", ".join(f"{name} {count}" for name, count in run["outcomes"].items())
+        )
+        previous = before.get(run["mode"])
+        if previous:
+            print(
+                f"{'  before':<10}{previous['requests_per_s']:>9}"
+                f"{previous['bookings_per_s']:>9}{previous['latency_ms']['p50']:>9}"
+                f"{previous['latency_ms']['p99']:>9}"
+            )
+        for violation in run["seats"]["violations"]:
+            print(f"  OVERSOLD: {violation}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--mode",
+        nargs="+",
+        choices=["threads", "processes"],
+        default=["threads", "processes"],
+    )
+    parser.add_argument("--bookers", type=int, default=500, help="Booking requests.")
+    parser.add_argument(
+        "--users",
+        type=int,
+        help="Distinct users making the bookings, one per booking by default.",
+    )
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--max-seats", type=int, default=100)
+    parser.add_argument("--max-tickets-per-user", type=int, default=1)
+    parser.add_argument("--quantity", type=int, default=1, help="Tickets per booking.")
+    parser.add_argument(
+        "--sample-interval",
+        type=float,
+        default=0.01,
+        help="Seconds between pg_locks samples.",
+    )
+    parser.add_argument("--output", help="Write the JSON report to this file.")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare with.")
+    parser.add_argument("--json", action="store_true", help="Print the JSON report.")
+    args = parser.parse_args()
+
+    database = settings.DATABASES["default"]
+    if database["ENGINE"].endswith("sqlite3") and not database["TEST"].get("NAME"):
+        # An in-memory database can't be shared with other processes
+        database["TEST"]["NAME"] = os.path.join(
+            tempfile.gettempdir(), "booking_load.sqlite3"
+        )
+    settings.DEBUG = False
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        admin = User.objects.create_user(
+            username="benchmark", password=None, user_type="admin"
+        )
+        tokens = create_bookers(args.users or args.bookers)
+        report = {
+            "database": connection.vendor,
+            "commit": git_commit(),
+            "started_at": timezone.now().isoformat(),
+            "max_seats": args.max_seats,
+            "max_tickets_per_user": args.max_tickets_per_user,
+            "runs": [run(mode, args, tokens, admin) for mode in args.mode],
+        }
+    finally:
+        connection.close()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    baseline = None
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, baseline)
+    if any(run["seats"]["violations"] for run in report["runs"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Load test comparing the sync read endpoints with their async versions.
+
+Serve the project twice with the same number of processes, once over WSGI
+and once over ASGI, for example
+
+    gunicorn config.wsgi --workers 2 --threads 8 --bind :8000
+    uvicorn config.asgi:application --workers 2 --port 8001
+
+then point the benchmark at both:
+
+    python benchmarks/read_endpoints.py --sync-url http://localhost:8000 \\
+        --async-url http://localhost:8001 --event 1 --token <access token> \\
+        --concurrency 200 --requests 5000
+
+The summary endpoint needs an admin token and the ticket list any token,
+both are skipped without --token. Only the standard library is used.
+"""
+
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ENDPOINTS = [
+    # name, sync path, async path, needs a token
+    ("event list", "/events/", "/events/async/", False),
+    ("event detail", "/events/{event}/", "/events/async/{event}/", False),
+    (
+        "event summary",
+        "/events/{event}/summary/",
+        "/events/async/{event}/summary/",
+        True,
+    ),
+    ("ticket list", "/events/tickets/", "/events/async/tickets/", True),
+]
+
+
+def fetch(url, headers):
+    request = urllib.request.Request(url, headers=headers)
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            ok = response.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def run(url, headers, concurrency, requests):
+    with ThreadPoolExecutor(concurrency) as pool:
+        # Warm up connections, caches and the servers' workers
+        list(pool.map(lambda _: fetch(url, headers), range(concurrency)))
+        started = time.perf_counter()
+        results = list(pool.map(lambda _: fetch(url, headers), range(requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, ok in results if ok)
+    errors = len(results) - len(latencies)
+    if len(latencies) < 2:
+        return {"rps": 0, "p50_ms": None, "p99_ms": None, "errors": errors}
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentiles[49] * 1000, 1),
+        "p99_ms": round(percentiles[98] * 1000, 1),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sync-url", default="http://localhost:8000")
+    parser.add_argument("--async-url", default="http://localhost:8001")
+    parser.add_argument("--event", type=int, default=1, help="Event id to read.")
+    parser.add_argument("--token", help="JWT access token, admin for summaries.")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--json", action="store_true", help="Print JSON results.")
+    args = parser.parse_args()
+
+    headers = {}
+    if args.token:
+        headers["Authorization"] = f"Bearer {args.token}"
+
+    report = []
+    for name, sync_path, async_path, needs_token in ENDPOINTS:
+        if needs_token and not args.token:
+            continue
+        for mode, base, path in [
+            ("sync", args.sync_url, sync_path),
+            ("async", args.async_url, async_path),
+        ]:
+            url = base.rstrip("/") + path.format(event=args.event)
+            result = run(url, headers, args.concurrency, args.requests)
+            report.append({"endpoint": name, "mode": mode, **result})
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(
+        f"{'endpoint':<15}{'mode':<7}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    )
+    for row in report:
+        print(
+            f"{row['endpoint']:<15}{row['mode']:<7}{row['rps']:>10}"
+            f"{str(row['p50_ms']):>10}{str(row['p99_ms']):>10}{row['errors']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,7 @@ import environ
 
 
 import os
+import tempfile
 
 env = environ.Env(
     # set casting, default value
@@ -58,7 +59,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "utils.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "utils.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -101,6 +104,17 @@ DATABASES = {
         "PORT": env("SQL_PORT"),
     }
 }
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Process local by default, point CACHE_URL at e.g. redis://host:6379/1 to
+# share cached responses and token revocations between workers
+
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
+# Seconds a cached event response may live; entries are invalidated on
+# writes, this only bounds memory use
+EVENT_CACHE_TIMEOUT = env.int("EVENT_CACHE_TIMEOUT", default=300)
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -154,8 +168,38 @@ REST_FRAMEWORK = {
     ]
 }
 
+# Seconds seats stay reserved for a hold before they are released again
+SEAT_HOLD_TTL = env.int("SEAT_HOLD_TTL", default=600)
+
+# Seconds a response stored for an Idempotency-Key is replayed to retries
+IDEMPOTENCY_KEY_TTL = env.int("IDEMPOTENCY_KEY_TTL", default=24 * 60 * 60)
+
+# Threads checking passwords for the async login view, and how many checks
+# may wait for them before logins are turned away with a 503
+LOGIN_HASHER_THREADS = env.int("LOGIN_HASHER_THREADS", default=4)
+LOGIN_HASHER_MAX_QUEUE = env.int("LOGIN_HASHER_MAX_QUEUE", default=64)
+
+# Smallest response body in bytes worth compressing. Brotli is used when the
+# client accepts it, gzip otherwise.
+COMPRESSION_MIN_SIZE = env.int("COMPRESSION_MIN_SIZE", default=1024)
+
+# Directory the worker processes share their metrics through, empty it when
+# deploying to restart the counters. Requests for /metrics need the token
+# as a bearer token when it is set.
+METRICS_DIR = env.str(
+    "METRICS_DIR", default=os.path.join(tempfile.gettempdir(), "appknox-metrics")
+)
+METRICS_FLUSH_INTERVAL = env.int("METRICS_FLUSH_INTERVAL", default=5)
+METRICS_TOKEN = env.str("METRICS_TOKEN", default="")
+
+# Processes hashing passwords for the import_users command, 0 uses one per
+# CPU, and the threads each web worker shares for bulk registrations
+USER_IMPORT_PROCESSES = env.int("USER_IMPORT_PROCESSES", default=0)
+USER_IMPORT_THREADS = env.int("USER_IMPORT_THREADS", default=4)
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),  # Set the expiration time to 15 minutes
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.UserTokenRefreshSerializer",
 }
 
 
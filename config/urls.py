@@ -2,6 +2,8 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework import permissions
 
+from utils.metrics import metrics_view
+
 
 from drf_spectacular.views import (
     SpectacularAPIView,
@@ -30,4 +32,5 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("users/", include("users.urls")),
     path("events/", include("event.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ] + swagger_urls
@@ -1,7 +1,24 @@
 from django.contrib import admin
 
-from .models import Event, Ticket
+from .models import BookingLedger, Event, Ticket
+
+
+class BookingCountersAdmin(admin.ModelAdmin):
+    # Booking counters are kept by event.booking, rows added or edited here
+    # would bypass them. Deleted tickets give their seats back, see
+    # event.booking.release_tickets.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class BookingLedgerAdmin(BookingCountersAdmin):
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 admin.site.register(Event)
-admin.site.register(Ticket)
+admin.site.register(Ticket, BookingCountersAdmin)
+admin.site.register(BookingLedger, BookingLedgerAdmin)
@@ -1,6 +1,43 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+
+def repair_sqlite_search(sender, using, **kwargs):
+    from .search import FTS_TABLE, install_sqlite_search
+
+    connection = connections[using]
+    if (
+        connection.vendor == "sqlite"
+        and FTS_TABLE in connection.introspection.table_names()
+    ):
+        install_sqlite_search(connection)
+
+
+def invalidate_event(sender, instance, **kwargs):
+    from .cache import bump_versions
+
+    # Covers saves and deletes outside the API, like the admin, the shell and
+    # cascades, so cached responses never outlive the row they were built from
+    bump_versions(instance.pk, catalogue=True)
+
+
+def release_deleted_ticket(sender, instance, origin=None, **kwargs):
+    from .booking import release_tickets
+    from .models import Event
+
+    # Tickets deleted with their event have nothing left to give back to
+    if isinstance(origin, Event) or getattr(origin, "model", None) is Event:
+        return
+    release_tickets([instance])
 
 
 class EventConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "event"
+
+    def ready(self):
+        post_migrate.connect(repair_sqlite_search, sender=self)
+        post_save.connect(invalidate_event, sender="event.Event")
+        post_delete.connect(invalidate_event, sender="event.Event")
+        post_delete.connect(release_deleted_ticket, sender="event.Ticket")
@@ -0,0 +1,267 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+
+from utils.permissions import IsAdminOrReadOnly
+from users.authentication import ClaimsJWTAuthentication
+from .cache import (
+    GLOBAL_VERSION_KEY,
+    aget_versions,
+    aresponse_cache_key,
+    conditional_response,
+    set_conditional_headers,
+)
+from .models import Event, EventStats, Ticket
+from .pagination import EventCursorPagination, TicketCursorPagination
+from .search import filter_events
+from .serializers import (
+    CompactTicketSerializer,
+    EventListFilterSerializer,
+    EventSerializer,
+    EventSummarySerializer,
+    TicketListFilterSerializer,
+    TicketSerializer,
+)
+
+
+class AsyncReadView(View):
+    # Base for the async counterparts of the read views in views.py, served
+    # under ASGI. DRF views are sync only, so authentication, permissions,
+    # conditional GET, caching and error responses are handled here with
+    # the same results as the DRF views.
+    authentication_class = ClaimsJWTAuthentication
+    permission_classes = []
+    # See VersionedCacheMixin, None disables caching
+    cache_prefix = None
+    cache_catalogue = False
+
+    async def get(self, request, *args, **kwargs):
+        # The DRF request wrapper provides query_params for the filters and
+        # the paginators
+        self.request = Request(request)
+        try:
+            await self.check_permissions()
+            state = await self.get_conditional_state()
+            if state is None:
+                return await self.get_response()
+
+            etag, last_modified, response = conditional_response(request, *state)
+            if response is None:
+                response = await self.get_response()
+                if response.status_code != 200:
+                    return response
+            return set_conditional_headers(response, etag, last_modified)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    async def check_permissions(self):
+        if not self.permission_classes:
+            return
+        # Role claims don't need a query, tokens without them load the user
+        authenticated = await sync_to_async(self.authentication_class().authenticate)(
+            self.request
+        )
+        self.request.user = authenticated[0] if authenticated else AnonymousUser()
+        for permission in self.permission_classes:
+            if not permission().has_permission(self.request, self):
+                if not self.request.user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied()
+
+    @property
+    def context(self):
+        # Serializer context, as the DRF views pass it
+        return {"request": self.request, "view": self}
+
+    async def get_conditional_state(self):
+        return None
+
+    async def get_response(self):
+        key = None
+        if self.cache_prefix:
+            key = await aresponse_cache_key(
+                self.request,
+                self.cache_prefix,
+                event_id=self.kwargs.get("pk"),
+                catalogue=self.cache_catalogue,
+            )
+            data = await cache.aget(key)
+            if data is not None:
+                return JsonResponse(data, safe=False)
+
+        data = await self.get_data()
+        if key:
+            await cache.aset(key, data, settings.EVENT_CACHE_TIMEOUT)
+        return JsonResponse(data, safe=False)
+
+    async def get_data(self):
+        raise NotImplementedError
+
+    def handle_exception(self, exc):
+        headers = {}
+        if isinstance(
+            exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)
+        ):
+            headers["WWW-Authenticate"] = (
+                self.authentication_class().authenticate_header(self.request)
+            )
+        data = exc.detail
+        if not isinstance(data, (list, dict)):
+            data = {"detail": data}
+        return JsonResponse(data, status=exc.status_code, safe=False, headers=headers)
+
+
+class AsyncEventListView(AsyncReadView):
+    cache_prefix = "async-list"
+    cache_catalogue = True
+
+    async def get(self, request, *args, **kwargs):
+        filters = EventListFilterSerializer(data=request.GET)
+        if not filters.is_valid():
+            return JsonResponse(filters.errors, status=400)
+        self.filters = filters.validated_data
+        # See EventListView
+        if self.filters["bookable"]:
+            self.cache_prefix = None
+        return await super().get(request, *args, **kwargs)
+
+    async def get_conditional_state(self):
+        if self.filters["bookable"]:
+            return None
+        return await aget_versions(GLOBAL_VERSION_KEY), None
+
+    async def get_data(self):
+        paginator = EventCursorPagination()
+        queryset = EventSerializer.sparse_queryset(
+            filter_events(Event.objects.all(), self.filters),
+            self.request,
+            required=EventCursorPagination.ordering,
+        )
+        events = await paginator.apaginate_queryset(queryset, self.request)
+        return {
+            "next": paginator.get_next_link(),
+            "results": EventSerializer(events, many=True, context=self.context).data,
+        }
+
+
+class AsyncEventDetailView(AsyncReadView):
+    cache_prefix = "async-detail"
+    queryset = Event.objects.all()
+    serializer_class = EventSerializer
+
+    async def get_conditional_state(self):
+        updated_at = (
+            await Event.objects.filter(pk=self.kwargs["pk"])
+            .values_list("updated_at", flat=True)
+            .afirst()
+        )
+        if updated_at is None:
+            return None
+        return (self.kwargs["pk"], updated_at), updated_at
+
+    def get_queryset(self):
+        return EventSerializer.sparse_queryset(self.queryset, self.request)
+
+    async def get_object(self):
+        event = await self.get_queryset().filter(pk=self.kwargs["pk"]).afirst()
+        if event is None:
+            raise exceptions.NotFound()
+        return event
+
+    async def get_data(self):
+        return self.serializer_class(await self.get_object(), context=self.context).data
+
+
+class AsyncEventSummaryView(AsyncEventDetailView):
+    permission_classes = [IsAdminOrReadOnly]
+    cache_prefix = "async-summary"
+    queryset = Event.objects.select_related("stats")
+    serializer_class = EventSummarySerializer
+
+    async def get_conditional_state(self):
+        markers = (
+            await Event.objects.filter(pk=self.kwargs["pk"])
+            .values_list("updated_at", "seats_updated_at")
+            .afirst()
+        )
+        if markers is None:
+            return None
+        return (self.kwargs["pk"], *markers), max(markers)
+
+    def get_queryset(self):
+        return self.queryset
+
+    async def get_object(self):
+        event = await super().get_object()
+        if not hasattr(event, "stats"):
+            stats = await sync_to_async(EventStats.rebuild)([event.pk])
+            event.stats = stats[event.pk]
+        return event
+
+
+class AsyncTicketListView(AsyncReadView):
+    permission_classes = [IsAuthenticated]
+
+    async def get_conditional_state(self):
+        # See TicketListView
+        if self.filters.get("when"):
+            return None
+        state = await Ticket.objects.filter(user_id=self.request.user.pk).aaggregate(
+            booked_at=Max("booking_time"),
+            count=Count("id"),
+            event_updated_at=Max("event__updated_at"),
+        )
+        last_modified = max(
+            filter(None, [state["booked_at"], state["event_updated_at"]]),
+            default=None,
+        )
+        return (self.request.user.pk, *state.values()), last_modified
+
+    async def get(self, request, *args, **kwargs):
+        filters = TicketListFilterSerializer(data=request.GET)
+        if not filters.is_valid():
+            return JsonResponse(filters.errors, status=400)
+        self.filters = filters.validated_data
+        return await super().get(request, *args, **kwargs)
+
+    async def get_data(self):
+        queryset = Ticket.objects.filter(user_id=self.request.user.pk)
+        when = self.filters.get("when")
+        if when == "upcoming":
+            queryset = queryset.filter(event__start_time__gte=timezone.now())
+        elif when == "past":
+            queryset = queryset.filter(event__start_time__lt=timezone.now())
+
+        paginator = TicketCursorPagination()
+        queryset = EventSerializer.sparse_queryset(
+            queryset.select_related("event"),
+            self.request,
+            related="event",
+            required=[field.name for field in Ticket._meta.concrete_fields],
+        )
+        tickets = await paginator.apaginate_queryset(queryset, self.request)
+        if not self.filters["compact"]:
+            return {
+                "next": paginator.get_next_link(),
+                "results": TicketSerializer(
+                    tickets, many=True, context=self.context
+                ).data,
+            }
+
+        events = {ticket.event_id: ticket.event for ticket in tickets}
+        return {
+            "next": paginator.get_next_link(),
+            "results": CompactTicketSerializer(tickets, many=True).data,
+            "events": {
+                str(pk): EventSerializer(event, context=self.context).data
+                for pk, event in events.items()
+            },
+        }
@@ -0,0 +1,304 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import serializers
+
+from .cache import bump_versions
+from .models import (
+    BookingClaim,
+    BookingLedger,
+    Event,
+    EventStats,
+    SeatHold,
+    Ticket,
+)
+
+
+# Validation against the already loaded event, booked is the quantity the
+# user holds for it if known. The authoritative checks happen atomically
+# while reserving.
+def check_bookable(event, quantity, booked=0):
+    # Check if the event's booking window is open
+    if not event.booking_start <= timezone.now() <= event.booking_end:
+        raise serializers.ValidationError(
+            "Booking window for this event is now closed.", code="window_closed"
+        )
+
+    # Check if user is trying to book more tickets than allowed per transaction
+    limit = event.max_tickets_per_user
+    if quantity > limit:
+        raise serializers.ValidationError(
+            f"You cannot book more than {limit} tickets per user.",
+            code="user_limit",
+        )
+
+    # Check if user's total tickets including this transaction exceed maximum allowed
+    if booked + quantity > limit:
+        raise serializers.ValidationError(
+            f"You've already booked {booked} tickets. You cannot book more than {limit} tickets in total for this event.",
+            code="user_limit",
+        )
+
+    if quantity > event.remaining_seats:
+        raise serializers.ValidationError(
+            "No more seats available for this event.", code="sold_out"
+        )
+
+
+def insert_ledger(user, event, quantity, held):
+    # INSERT ... ON CONFLICT DO NOTHING, which tells whether the row was new
+    # without the savepoint and failed insert create() would need. Postgres
+    # and SQLite support it.
+    ledger = BookingLedger._meta
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {connection.ops.quote_name(ledger.db_table)} "
+            "(user_id, event_id, quantity, held) VALUES (%s, %s, %s, %s) "
+            "ON CONFLICT (user_id, event_id) DO NOTHING RETURNING id",
+            [user.pk, event.pk, quantity, held],
+        )
+        return cursor.fetchone() is not None
+
+
+# Adds quantity to the user's ledger row for the event, as booked tickets or
+# as held seats, and returns True when this is the user's first booking of
+# tickets for it
+def reserve_user_quantity(user, event, quantity, hold=False):
+    limit = event.max_tickets_per_user
+    if quantity > limit:
+        raise serializers.ValidationError(
+            f"You cannot book more than {limit} tickets per user.",
+            code="user_limit",
+        )
+
+    ledger = BookingLedger.objects.filter(user_id=user.pk, event=event)
+    within_limit = ledger.filter(quantity__lte=limit - quantity - F("held"))
+
+    # Most bookings are the user's first for the event, so the row is
+    # inserted right away and only updated when it turns out to exist
+    if insert_ledger(user, event, 0 if hold else quantity, quantity if hold else 0):
+        return not hold
+
+    if hold:
+        if within_limit.update(held=F("held") + quantity):
+            return False
+    elif within_limit.filter(quantity__gt=0).update(quantity=F("quantity") + quantity):
+        return False
+    # A row without tickets only held seats so far
+    elif within_limit.update(quantity=F("quantity") + quantity):
+        return True
+
+    booked = ledger.values_list(F("quantity") + F("held"), flat=True).first() or 0
+    raise serializers.ValidationError(
+        f"You've already booked {booked} tickets. You cannot book more than {limit} tickets in total for this event.",
+        code="user_limit",
+    )
+
+
+def reserve_seats(event, quantity):
+    # A single conditional UPDATE claims the seats; the row lock it takes is
+    # held until the surrounding transaction commits.
+    reserved = Event.objects.filter(
+        pk=event.pk, booked_seats__lte=F("max_seats") - quantity
+    ).update(booked_seats=F("booked_seats") + quantity, seats_updated_at=timezone.now())
+    if not reserved:
+        raise serializers.ValidationError(
+            "No more seats available for this event.", code="sold_out"
+        )
+
+
+def record_booking(event, quantity, first_booking):
+    updated = EventStats.objects.filter(event=event).update(
+        bookings=F("bookings") + 1,
+        tickets_booked=F("tickets_booked") + quantity,
+        unique_bookers=F("unique_bookers") + int(first_booking),
+        revenue=F("revenue") + quantity * event.ticket_cost,
+    )
+    if not updated:
+        # Events created before stats existed get theirs built from the
+        # tickets, including the one just inserted
+        EventStats.rebuild([event.pk])
+
+
+def book_tickets(user, event, quantity=1):
+    with transaction.atomic():
+        # Touch the per-user row first so the contended event row is locked
+        # for as short a time as possible
+        first_booking = reserve_user_quantity(user, event, quantity)
+        reserve_seats(event, quantity)
+        ticket = Ticket.objects.create(user_id=user.pk, event=event, quantity=quantity)
+        record_booking(event, quantity, first_booking)
+        bump_versions(event.pk)
+        return ticket
+
+
+# Books every (event, quantity) pair or none of them
+def book_cart(user, items):
+    items = sorted(items, key=lambda item: item[0].pk)
+    with transaction.atomic():
+        # Like single bookings, ledger rows are locked before event rows
+        first_bookings = [
+            reserve_user_quantity(user, event, quantity) for event, quantity in items
+        ]
+        # Lock all event rows up front in id order, so carts sharing events
+        # queue behind each other instead of deadlocking
+        list(
+            Event.objects.select_for_update()
+            .filter(pk__in=[event.pk for event, _ in items])
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        for event, quantity in items:
+            reserve_seats(event, quantity)
+        tickets = Ticket.objects.bulk_create(
+            Ticket(user_id=user.pk, event=event, quantity=quantity)
+            for event, quantity in items
+        )
+        for (event, quantity), first_booking in zip(items, first_bookings):
+            record_booking(event, quantity, first_booking)
+            bump_versions(event.pk)
+        return tickets
+
+
+# Allocates seats to the oldest pending claims of an event, one at a time
+# in arrival order. Claims locked by another worker are skipped, so several
+# workers can drain the same queue. Returns the number of claims processed.
+def drain_booking_queue(event_id, batch_size=100):
+    with transaction.atomic():
+        claims = list(
+            BookingClaim.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("user")
+            .filter(event_id=event_id, status="pending")
+            .order_by("id")[:batch_size]
+        )
+        if not claims:
+            return 0
+
+        event = Event.objects.get(pk=event_id)
+        for claim in claims:
+            try:
+                # Claims were accepted inside the booking window, so only
+                # the seat and per-user limits apply now
+                claim.ticket = book_tickets(claim.user, event, claim.quantity)
+                claim.status = "booked"
+            except serializers.ValidationError as exc:
+                claim.status = "rejected"
+                claim.reason = str(exc.detail[0])
+            claim.processed_at = timezone.now()
+        BookingClaim.objects.bulk_update(
+            claims, ["status", "ticket", "reason", "processed_at"]
+        )
+        return len(claims)
+
+
+# Reserves seats for the user without selling them yet. Held seats count
+# against max_seats and max_tickets_per_user until the hold is confirmed or
+# released by release_expired_holds().
+def hold_seats(user, event, quantity=1):
+    with transaction.atomic():
+        reserve_user_quantity(user, event, quantity, hold=True)
+        reserve_seats(event, quantity)
+        bump_versions(event.pk)
+        return SeatHold.objects.create(
+            user_id=user.pk,
+            event=event,
+            quantity=quantity,
+            expires_at=timezone.now() + timedelta(seconds=settings.SEAT_HOLD_TTL),
+        )
+
+
+def confirm_hold(user, hold_id):
+    with transaction.atomic():
+        hold = (
+            SeatHold.objects.select_for_update(of=("self",))
+            .select_related("event")
+            .filter(pk=hold_id, user_id=user.pk, expires_at__gt=timezone.now())
+            .first()
+        )
+        if hold is None:
+            raise serializers.ValidationError(
+                "This hold has expired.", code="hold_expired"
+            )
+
+        # The seats are already reserved, they only move from held to booked
+        event, quantity = hold.event, hold.quantity
+        ledger = BookingLedger.objects.filter(user_id=user.pk, event=event)
+        first_booking = bool(
+            ledger.filter(quantity=0).update(
+                quantity=quantity, held=F("held") - quantity
+            )
+        )
+        if not first_booking:
+            ledger.update(quantity=F("quantity") + quantity, held=F("held") - quantity)
+        # booked_seats doesn't change but the stats do, and summaries are
+        # validated against seats_updated_at
+        Event.objects.filter(pk=event.pk).update(seats_updated_at=timezone.now())
+        ticket = Ticket.objects.create(user_id=user.pk, event=event, quantity=quantity)
+        record_booking(event, quantity, first_booking)
+        hold.delete()
+        bump_versions(event.pk)
+        return ticket
+
+
+# Releases the seats of expired holds in batches, with one UPDATE per event
+# and per ledger row. Returns the number of holds released.
+def release_expired_holds(batch_size=500):
+    with transaction.atomic():
+        holds = list(
+            SeatHold.objects.select_for_update(skip_locked=True)
+            .filter(expires_at__lte=timezone.now())
+            .order_by("expires_at")
+            .values_list("pk", "user_id", "event_id", "quantity")[:batch_size]
+        )
+        if not holds:
+            return 0
+
+        seats = Counter()
+        ledgers = Counter()
+        for _, user_id, event_id, quantity in holds:
+            seats[event_id] += quantity
+            ledgers[user_id, event_id] += quantity
+
+        # Same lock order as bookings, ledger rows first and then events
+        for (user_id, event_id), quantity in sorted(ledgers.items()):
+            BookingLedger.objects.filter(user_id=user_id, event_id=event_id).update(
+                held=F("held") - quantity
+            )
+        for event_id, quantity in sorted(seats.items()):
+            Event.objects.filter(pk=event_id).update(
+                booked_seats=F("booked_seats") - quantity,
+                seats_updated_at=timezone.now(),
+            )
+            bump_versions(event_id)
+        SeatHold.objects.filter(pk__in=[hold[0] for hold in holds]).delete()
+        return len(holds)
+
+
+# Gives the seats of deleted tickets back: the events' booked seats, the
+# users' ledger rows and the events' stats
+def release_tickets(tickets):
+    seats = Counter()
+    ledgers = Counter()
+    for ticket in tickets:
+        seats[ticket.event_id] += ticket.quantity
+        ledgers[ticket.user_id, ticket.event_id] += ticket.quantity
+
+    with transaction.atomic():
+        # Same lock order as bookings, ledger rows first and then events
+        for (user_id, event_id), quantity in sorted(ledgers.items()):
+            BookingLedger.objects.filter(user_id=user_id, event_id=event_id).update(
+                quantity=F("quantity") - quantity
+            )
+        for event_id, quantity in sorted(seats.items()):
+            Event.objects.filter(pk=event_id).update(
+                booked_seats=F("booked_seats") - quantity,
+                seats_updated_at=timezone.now(),
+            )
+            bump_versions(event_id)
+        # Whether the user still counts as a booker depends on their other
+        # tickets, deletes are rare enough to recount
+        EventStats.rebuild(list(seats))
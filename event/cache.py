@@ -0,0 +1,151 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+GLOBAL_VERSION_KEY = "event:version"
+
+
+def event_version_key(event_id):
+    return f"event:{event_id}:version"
+
+
+def get_versions(*keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Seed from the clock so an evicted version never restarts at a
+            # value that old entries were stored under
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(*keys):
+    # get_versions() for async views, the cache calls don't block the loop
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def bump_versions(event_id=None, catalogue=False):
+    # Invalidate once the change is visible to other connections, otherwise
+    # a concurrent read could cache the old rows under the new version
+    keys = []
+    if event_id is not None:
+        keys.append(event_version_key(event_id))
+    if catalogue:
+        keys.append(GLOBAL_VERSION_KEY)
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def response_cache_key(request, prefix, event_id=None, catalogue=False):
+    # Keys carry the catalogue version and, for responses about a single
+    # event, that event's version, so bump_versions() invalidates exactly
+    # the affected entries
+    keys = _version_keys(event_id, catalogue)
+    return _response_cache_key(request, prefix, get_versions(*keys))
+
+
+async def aresponse_cache_key(request, prefix, event_id=None, catalogue=False):
+    keys = _version_keys(event_id, catalogue)
+    return _response_cache_key(request, prefix, await aget_versions(*keys))
+
+
+def _version_keys(event_id, catalogue):
+    keys = []
+    if catalogue:
+        keys.append(GLOBAL_VERSION_KEY)
+    if event_id is not None:
+        keys.append(event_version_key(event_id))
+    return keys
+
+
+def _response_cache_key(request, prefix, versions):
+    versions = ".".join(str(version) for version in versions)
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f"event:{prefix}:{versions}:{url}"
+
+
+def conditional_response(request, values, last_modified):
+    # Returns the ETag and Last-Modified of a response derived from values,
+    # plus a bare 304 response when the client's copy is still current
+    fingerprint = repr((values, request.get_full_path())).encode()
+    etag = quote_etag(hashlib.sha1(fingerprint).hexdigest())
+    last_modified = last_modified and int(last_modified.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    return etag, last_modified, response
+
+
+def set_conditional_headers(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+class VersionedCacheMixin:
+    # Caches the response data of GET requests, see response_cache_key().
+    # Views can skip the cache for a request by returning None as its key.
+    cache_prefix = None
+    cache_catalogue = False
+
+    def get_cache_key(self, request):
+        return response_cache_key(
+            request,
+            self.cache_prefix,
+            event_id=self.kwargs.get("pk"),
+            catalogue=self.cache_catalogue,
+        )
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_cache_key(request)
+        if key is None:
+            return super().get(request, *args, **kwargs)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.EVENT_CACHE_TIMEOUT)
+        return response
+
+
+class ConditionalGetMixin:
+    # Answers GET requests with ETag and Last-Modified headers and returns a
+    # bare 304 when the client's copy is still current, before any caching
+    # or serialization happens. Views return the values their response is
+    # derived from from get_conditional_state(), plus its last modification
+    # time, or None when there is nothing to validate against.
+
+    def get_conditional_state(self):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        state = self.get_conditional_state()
+        if state is None:
+            return super().get(request, *args, **kwargs)
+
+        etag, last_modified, response = conditional_response(request, *state)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        return set_conditional_headers(response, etag, last_modified)
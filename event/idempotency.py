@@ -0,0 +1,86 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+
+class IdempotentPostMixin:
+    # Lets authenticated clients retry POST requests safely. The first
+    # successful response for a user's Idempotency-Key is stored in the same
+    # transaction as the changes it reports and replayed to every retry
+    # without running the view again. Failed requests aren't stored, so
+    # they can be retried with the same key.
+
+    def post(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or not request.user.is_authenticated:
+            return super().post(request, *args, **kwargs)
+        if len(key) > 255:
+            raise ValidationError(
+                {IDEMPOTENCY_HEADER: ["Ensure this value has at most 255 characters."]}
+            )
+
+        fingerprint = self.get_request_fingerprint(request)
+        keys = IdempotencyKey.objects.filter(user_id=request.user.pk, key=key)
+        stored = keys.first()
+        if stored is not None and stored.expires_at > timezone.now():
+            return self.replay(stored, fingerprint)
+
+        try:
+            with transaction.atomic():
+                if stored is not None:
+                    # Expired, the key may be used again
+                    keys.filter(pk=stored.pk).delete()
+                # Concurrent requests with the same key wait on the unique
+                # constraint until this transaction finishes
+                stored = IdempotencyKey.objects.create(
+                    user_id=request.user.pk,
+                    key=key,
+                    fingerprint=fingerprint,
+                    expires_at=timezone.now()
+                    + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                )
+                response = super().post(request, *args, **kwargs)
+                if not status.is_success(response.status_code):
+                    transaction.set_rollback(True)
+                    return response
+                stored.status_code = response.status_code
+                stored.response = response.data
+                stored.save(update_fields=["status_code", "response"])
+                return response
+        except IntegrityError:
+            stored = keys.first()
+            if stored is None:
+                raise
+            return self.replay(stored, fingerprint)
+
+    def get_request_fingerprint(self, request):
+        data = request.data
+        if hasattr(data, "lists"):
+            data = dict(data.lists())
+        payload = json.dumps(
+            [request.method, request.path, data], sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def replay(self, stored, fingerprint):
+        if stored.fingerprint != fingerprint:
+            return Response(
+                {"detail": "This Idempotency-Key was used for a different request."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        return Response(
+            stored.response,
+            status=stored.status_code,
+            headers={"Idempotent-Replayed": "true"},
+        )
@@ -0,0 +1,94 @@
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from .cache import bump_versions
+from .models import Event, EventStats
+from .serializers import EventSerializer
+
+
+# Creates events from an iterable of field dicts and yields a result for
+# every rejected row, plus a progress report after every batch. Rows are
+# validated with the EventSerializer rules and each valid batch is inserted
+# with one bulk_create in its own transaction, so the input is never held
+# in memory as a whole and an interrupted import keeps its finished batches.
+def import_events(rows, created_by_id, batch_size=1000):
+    # One serializer validates every row, like the child of a ListSerializer,
+    # so its fields are only built once
+    serializer = EventSerializer()
+    created = processed = 0
+    rows = enumerate(rows, 1)
+    while batch := list(islice(rows, batch_size)):
+        events = []
+        for number, row in batch:
+            try:
+                if isinstance(row, serializers.ValidationError):
+                    raise row
+                attrs = serializer.run_validation(row)
+            except serializers.ValidationError as exc:
+                yield {"row": number, "errors": exc.detail}
+                continue
+            events.append(Event(**attrs, created_by_id=created_by_id))
+
+        with transaction.atomic():
+            Event.objects.bulk_create(events)
+            EventStats.objects.bulk_create(EventStats(event=event) for event in events)
+            bump_versions(catalogue=True)
+
+        created += len(events)
+        processed += len(batch)
+        yield {"processed": processed, "created": created}
+
+
+INVALID_UTF8 = "The row is not valid UTF-8."
+
+
+def row_error(message):
+    return serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]})
+
+
+def is_utf8(text):
+    # Undecodable bytes are left in the text as lone surrogates
+    try:
+        text.encode("utf-8")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+# Yields the field dicts of CSV or NDJSON input given as lines of text, and a
+# ValidationError for every row that can't be read. Input decoded with the
+# surrogateescape error handler has its undecodable bytes reported per row.
+def parse_rows(lines, input_format):
+    if input_format == "csv":
+        reader = csv.DictReader(lines)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as exc:
+                yield row_error(f"Invalid CSV: {exc}.")
+                continue
+            values = [value for value in row.values() if isinstance(value, str)]
+            if not all(map(is_utf8, values)):
+                yield row_error(INVALID_UTF8)
+                continue
+            # Empty cells fall back to the field defaults
+            yield {name: value for name, value in row.items() if value != ""}
+
+    for line in lines:
+        if not line.strip():
+            continue
+        if not is_utf8(line):
+            yield row_error(INVALID_UTF8)
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # Reported as invalid data by the validation
+            yield line
@@ -0,0 +1,55 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from event.imports import import_events, parse_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Create events from a CSV or NDJSON file with the fields of event "
+        "creation. Rejected rows are written to stdout as JSON lines."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--created-by", required=True, help="Username of the events' admin."
+        )
+        parser.add_argument(
+            "--format",
+            choices=["csv", "ndjson"],
+            help="Defaults to the file extension.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user = (
+            get_user_model()
+            .objects.filter(username=options["created_by"])
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if user is None:
+            raise CommandError(f'User "{options["created_by"]}" does not exist.')
+        input_format = options["format"] or (
+            "csv" if options["path"].endswith(".csv") else "ndjson"
+        )
+
+        # Undecodable lines are reported as rejected rows
+        with open(
+            options["path"], newline="", encoding="utf-8", errors="surrogateescape"
+        ) as file:
+            created = 0
+            for result in import_events(
+                parse_rows(file, input_format), user, options["batch_size"]
+            ):
+                if "row" in result:
+                    self.stdout.write(json.dumps(result))
+                else:
+                    created = result["created"]
+                    self.stderr.write(
+                        f"Processed {result['processed']} rows, created {created} events."
+                    )
+        self.stderr.write(self.style.SUCCESS(f"Created {created} events."))
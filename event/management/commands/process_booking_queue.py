@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from event.booking import drain_booking_queue
+from event.models import BookingClaim
+
+
+class Command(BaseCommand):
+    help = "Allocate seats to pending booking claims of queued booking events."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new claims instead of exiting once drained.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0.5,
+            help="Seconds to wait between polls when the queue is empty.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = self.drain(options["batch_size"])
+            if processed:
+                self.stdout.write(f"Processed {processed} claims.")
+            elif not options["loop"]:
+                return
+            else:
+                time.sleep(options["interval"])
+
+    def drain(self, batch_size):
+        event_ids = (
+            BookingClaim.objects.filter(status="pending")
+            .values_list("event_id", flat=True)
+            .distinct()
+        )
+        return sum(drain_booking_queue(event_id, batch_size) for event_id in event_ids)
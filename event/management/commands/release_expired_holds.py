@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from event.booking import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Release the seats of expired seat holds."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        released = 0
+        while True:
+            batch = release_expired_holds(options["batch_size"])
+            if not batch:
+                break
+            released += batch
+        self.stdout.write(f"Released {released} expired holds.")
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.2 on 2026-10-18 11:31
+
+import logging
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_booked_seats(apps, schema_editor):
+    Event = apps.get_model("event", "Event")
+    Ticket = apps.get_model("event", "Ticket")
+    booked = (
+        Ticket.objects.filter(event=OuterRef("pk"))
+        .values("event")
+        .annotate(total=Sum("quantity"))
+        .values("total")
+    )
+    Event.objects.update(booked_seats=Coalesce(Subquery(booked), 0))
+
+    # Nothing prevented overselling before, the tickets sold stay valid and
+    # the event gets as many seats as it sold so the constraint holds
+    oversold = Event.objects.filter(booked_seats__gt=F("max_seats"))
+    for pk, booked_seats, max_seats in oversold.values_list(
+        "pk", "booked_seats", "max_seats"
+    ):
+        logging.getLogger(__name__).warning(
+            "Event %s was oversold, %s seats booked of %s. Raised max_seats to %s.",
+            pk,
+            booked_seats,
+            max_seats,
+            booked_seats,
+        )
+    oversold.update(max_seats=F("booked_seats"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("event", "0004_ticket_quantity"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="booked_seats",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_booked_seats, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="event",
+            constraint=models.CheckConstraint(
+                check=models.Q(("booked_seats__lte", models.F("max_seats"))),
+                name="event_booked_seats_lte_max_seats",
+            ),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.2 on 2026-10-18 11:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def backfill_booking_ledgers(apps, schema_editor):
+    BookingLedger = apps.get_model("event", "BookingLedger")
+    Ticket = apps.get_model("event", "Ticket")
+    totals = Ticket.objects.values("user", "event").annotate(total=Sum("quantity"))
+    BookingLedger.objects.bulk_create(
+        BookingLedger(user_id=row["user"], event_id=row["event"], quantity=row["total"])
+        for row in totals.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("event", "0005_event_booked_seats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookingLedger",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.PositiveIntegerField(default=0)),
+                (
+                    "event",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="booking_ledgers",
+                        to="event.event",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="booking_ledgers",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="bookingledger",
+            constraint=models.UniqueConstraint(
+                fields=("user", "event"), name="unique_booking_ledger_user_event"
+            ),
+        ),
+        migrations.RunPython(backfill_booking_ledgers, migrations.RunPython.noop),
+    ]
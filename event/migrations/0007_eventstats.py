@@ -0,0 +1,67 @@
+# Generated by Django 4.2.2 on 2026-10-18 11:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_event_stats(apps, schema_editor):
+    Event = apps.get_model("event", "Event")
+    EventStats = apps.get_model("event", "EventStats")
+    totals = Event.objects.annotate(
+        total_bookings=Count("tickets"),
+        total_tickets=Coalesce(Sum("tickets__quantity"), 0),
+        total_bookers=Count("tickets__user", distinct=True),
+        total_revenue=Coalesce(
+            Sum(
+                F("tickets__quantity") * F("ticket_cost"),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            0,
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    ).order_by()
+    EventStats.objects.bulk_create(
+        EventStats(
+            event_id=event.pk,
+            bookings=event.total_bookings,
+            tickets_booked=event.total_tickets,
+            unique_bookers=event.total_bookers,
+            revenue=event.total_revenue,
+        )
+        for event in totals.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("event", "0006_bookingledger"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EventStats",
+            fields=[
+                (
+                    "event",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="event.event",
+                    ),
+                ),
+                ("bookings", models.PositiveIntegerField(default=0)),
+                ("tickets_booked", models.PositiveIntegerField(default=0)),
+                ("unique_bookers", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+            ],
+        ),
+        migrations.RunPython(backfill_event_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.2 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("event", "0007_eventstats"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="event",
+            options={"ordering": ["start_time", "id"]},
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["start_time", "id"], name="event_start_time_id_idx"
+            ),
+        ),
+    ]
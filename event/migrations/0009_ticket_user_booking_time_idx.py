@@ -0,0 +1,20 @@
+# Generated by Django 4.2.2 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("event", "0008_event_start_time_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ticket",
+            index=models.Index(
+                fields=["user", "booking_time", "id"],
+                name="ticket_user_booking_time_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.2 on 2026-10-18 11:36
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("event", "0009_ticket_user_booking_time_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="seats_updated_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(fields=["updated_at"], name="event_updated_at_idx"),
+        ),
+    ]
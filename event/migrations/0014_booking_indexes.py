@@ -0,0 +1,25 @@
+# Generated by Django 4.2.2 on 2026-10-18 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("event", "0013_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                condition=models.Q(("booked_seats__lt", models.F("max_seats"))),
+                fields=["booking_end", "booking_start"],
+                name="event_bookable_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ticket",
+            index=models.Index(fields=["event", "user"], name="ticket_event_user_idx"),
+        ),
+    ]
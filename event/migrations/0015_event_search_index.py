@@ -0,0 +1,69 @@
+from django.db import migrations
+
+# Frozen copies of the definitions in event.search at the time of this
+# migration, which must not change with later edits of that module
+SEARCH_FIELDS = ("title", "description", "location")
+FTS_TABLE = "event_event_fts"
+TABLE = "event_event"
+
+COLUMNS = ", ".join(SEARCH_FIELDS)
+NEW = ", ".join(f"new.{field}" for field in SEARCH_FIELDS)
+OLD = ", ".join(f"old.{field}" for field in SEARCH_FIELDS)
+FTS_INSERT = f"INSERT INTO {FTS_TABLE}(rowid, {COLUMNS}) VALUES (new.id, {NEW});"
+FTS_DELETE = (
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNS}) "
+    f"VALUES ('delete', old.id, {OLD});"
+)
+TRIGGERS = {
+    f"{FTS_TABLE}_insert": f"AFTER INSERT ON {TABLE} BEGIN {FTS_INSERT} END",
+    f"{FTS_TABLE}_delete": f"AFTER DELETE ON {TABLE} BEGIN {FTS_DELETE} END",
+    f"{FTS_TABLE}_update": (
+        f"AFTER UPDATE OF {COLUMNS} ON {TABLE} BEGIN {FTS_DELETE} {FTS_INSERT} END"
+    ),
+}
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql":
+        from django.contrib.postgres.indexes import GinIndex
+        from django.contrib.postgres.search import SearchVector
+
+        Event = apps.get_model("event", "Event")
+        schema_editor.add_index(
+            Event,
+            GinIndex(
+                SearchVector(*SEARCH_FIELDS, config="english"),
+                name="event_search_idx",
+            ),
+        )
+    elif connection.vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"{COLUMNS}, content='{TABLE}', content_rowid='id')"
+        )
+        for name, body in TRIGGERS.items():
+            schema_editor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS event_search_idx")
+    elif connection.vendor == "sqlite":
+        for name in TRIGGERS:
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("event", "0014_booking_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
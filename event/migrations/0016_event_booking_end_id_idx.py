@@ -0,0 +1,19 @@
+# Generated by Django 4.2.2 on 2026-10-18 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("event", "0015_event_search_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["booking_end", "id"], name="event_booking_end_id_idx"
+            ),
+        ),
+    ]
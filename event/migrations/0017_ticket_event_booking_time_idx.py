@@ -0,0 +1,20 @@
+# Generated by Django 4.2.2 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("event", "0016_event_booking_end_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ticket",
+            index=models.Index(
+                fields=["event", "booking_time", "id"],
+                name="ticket_event_booking_time_idx",
+            ),
+        ),
+    ]
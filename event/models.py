@@ -1,4 +1,9 @@
-from django.db import models
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -26,9 +31,69 @@ class Event(models.Model):
     created_by = models.ForeignKey(
         User, related_name="events", on_delete=models.CASCADE
     )
+    # Bookings are queued as claims and allocated by a worker instead of
+    # competing for the event row, meant for flash sales
+    queued_booking = models.BooleanField(default=False)
+    # Seat inventory counter, only ever changed through event.booking so that
+    # availability checks never have to aggregate over the ticket table.
+    booked_seats = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Moves with booked_seats, bookings don't touch updated_at
+    seats_updated_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
-        ordering = ["start_time"]
+        ordering = ["start_time", "id"]
+        indexes = [
+            models.Index(fields=["start_time", "id"], name="event_start_time_id_idx"),
+            models.Index(fields=["updated_at"], name="event_updated_at_idx"),
+            # Events whose booking window is open, in closing order
+            models.Index(fields=["booking_end", "id"], name="event_booking_end_id_idx"),
+            # Events that can still sell seats, for booking window lookups.
+            # The window itself can't go into the condition as it depends on
+            # the current time, booking_end comes first so closed windows are
+            # skipped by the range scan.
+            models.Index(
+                fields=["booking_end", "booking_start"],
+                name="event_bookable_idx",
+                condition=models.Q(booked_seats__lt=models.F("max_seats")),
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(booked_seats__lte=models.F("max_seats")),
+                name="event_booked_seats_lte_max_seats",
+            ),
+        ]
+
+    # Columns that only event.booking changes, in SQL. Saving a loaded event
+    # never writes them back, so a copy loaded before a booking can't undo it.
+    BOOKING_COUNTERS = ("booked_seats", "seats_updated_at")
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if self._state.adding or self.pk is None:
+            # New events start with their stats, so bookings and summaries
+            # never have to rebuild them
+            with transaction.atomic():
+                super().save(*args, update_fields=update_fields, **kwargs)
+                EventStats.objects.bulk_create(
+                    [EventStats(event=self)], ignore_conflicts=True
+                )
+            return
+        if update_fields is None:
+            update_fields = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.BOOKING_COUNTERS
+            ]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+    @property
+    def remaining_seats(self):
+        return self.max_seats - self.booked_seats
+
+    @property
+    def sold_out(self):
+        return self.booked_seats >= self.max_seats
 
 
 class Ticket(models.Model):
@@ -36,3 +101,165 @@ class Ticket(models.Model):
     event = models.ForeignKey(Event, related_name="tickets", on_delete=models.CASCADE)
     booking_time = models.DateTimeField(auto_now_add=True)
     quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "booking_time", "id"],
+                name="ticket_user_booking_time_idx",
+            ),
+            # Per-event aggregates such as unique bookers in EventStats
+            models.Index(fields=["event", "user"], name="ticket_event_user_idx"),
+            # Attendee exports walk an event's tickets in booking order
+            models.Index(
+                fields=["event", "booking_time", "id"],
+                name="ticket_event_booking_time_idx",
+            ),
+        ]
+
+
+class BookingLedger(models.Model):
+    # Running total of seats each user has booked or holds per event, used to
+    # enforce max_tickets_per_user without aggregating the user's tickets.
+    user = models.ForeignKey(
+        User, related_name="booking_ledgers", on_delete=models.CASCADE
+    )
+    event = models.ForeignKey(
+        Event, related_name="booking_ledgers", on_delete=models.CASCADE
+    )
+    quantity = models.PositiveIntegerField(default=0)
+    held = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "event"], name="unique_booking_ledger_user_event"
+            ),
+        ]
+
+
+class EventStats(models.Model):
+    # Materialized booking totals for an event, kept up to date by
+    # event.booking so summaries are read from a single row.
+    event = models.OneToOneField(
+        Event, primary_key=True, related_name="stats", on_delete=models.CASCADE
+    )
+    bookings = models.PositiveIntegerField(default=0)
+    tickets_booked = models.PositiveIntegerField(default=0)
+    unique_bookers = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    @classmethod
+    def rebuild(cls, event_ids):
+        # Recompute the stats of the given events with one grouped query
+        # over their tickets and upsert the results
+        totals = Event.objects.filter(pk__in=event_ids).annotate(
+            total_bookings=models.Count("tickets"),
+            total_tickets=Coalesce(models.Sum("tickets__quantity"), 0),
+            total_bookers=models.Count("tickets__user", distinct=True),
+            total_revenue=Coalesce(
+                models.Sum(
+                    models.F("tickets__quantity") * models.F("ticket_cost"),
+                    output_field=models.DecimalField(max_digits=12, decimal_places=2),
+                ),
+                Decimal("0"),
+            ),
+        )
+        stats = [
+            cls(
+                event_id=row["pk"],
+                bookings=row["total_bookings"],
+                tickets_booked=row["total_tickets"],
+                unique_bookers=row["total_bookers"],
+                revenue=row["total_revenue"],
+            )
+            for row in totals.order_by().values(
+                "pk",
+                "total_bookings",
+                "total_tickets",
+                "total_bookers",
+                "total_revenue",
+            )
+        ]
+        cls.objects.bulk_create(
+            stats,
+            update_conflicts=True,
+            unique_fields=["event"],
+            update_fields=["bookings", "tickets_booked", "unique_bookers", "revenue"],
+        )
+        return {row.event_id: row for row in stats}
+
+
+class BookingClaim(models.Model):
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("booked", "Booked"),
+        ("rejected", "Rejected"),
+    )
+
+    user = models.ForeignKey(
+        User, related_name="booking_claims", on_delete=models.CASCADE
+    )
+    event = models.ForeignKey(
+        Event, related_name="booking_claims", on_delete=models.CASCADE
+    )
+    quantity = models.PositiveIntegerField(default=1)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    ticket = models.OneToOneField(
+        Ticket,
+        related_name="claim",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    reason = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["event", "id"],
+                condition=models.Q(status="pending"),
+                name="claim_pending_idx",
+            ),
+        ]
+
+
+class SeatHold(models.Model):
+    user = models.ForeignKey(User, related_name="seat_holds", on_delete=models.CASCADE)
+    event = models.ForeignKey(
+        Event, related_name="seat_holds", on_delete=models.CASCADE
+    )
+    quantity = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["expires_at"], name="seat_hold_expires_at_idx"),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    # First successful response to a request sent with an Idempotency-Key
+    # header, replayed to retries of that request.
+    user = models.ForeignKey(
+        User, related_name="idempotency_keys", on_delete=models.CASCADE
+    )
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="unique_idempotency_key_user_key"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"], name="idempotency_expires_at_idx"),
+        ]
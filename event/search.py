@@ -0,0 +1,129 @@
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+SEARCH_FIELDS = ("title", "description", "location")
+SEARCH_CONFIG = "english"
+FTS_TABLE = "event_event_fts"
+
+
+# Applies the validated EventListFilterSerializer filters to an event queryset
+def filter_events(queryset, filters):
+    if "event_type" in filters:
+        queryset = queryset.filter(event_type=filters["event_type"])
+    if "location" in filters:
+        queryset = queryset.filter(location__icontains=filters["location"])
+    for name, lookup in [
+        ("start_after", "start_time__gte"),
+        ("start_before", "start_time__lt"),
+        ("end_after", "end_time__gte"),
+        ("end_before", "end_time__lt"),
+        ("min_cost", "ticket_cost__gte"),
+        ("max_cost", "ticket_cost__lte"),
+    ]:
+        if name in filters:
+            queryset = queryset.filter(**{lookup: filters[name]})
+    if filters.get("bookable"):
+        # Same condition as event_bookable_idx plus the booking window
+        now = timezone.now()
+        queryset = queryset.filter(
+            booking_start__lte=now,
+            booking_end__gte=now,
+            booked_seats__lt=F("max_seats"),
+        )
+    if "q" in filters:
+        queryset = search_events(queryset, filters["q"])
+    return queryset
+
+
+# Full-text search over events. PostgreSQL matches against a GIN expression
+# index on the tsvector of SEARCH_FIELDS, SQLite against an FTS5 table that
+# triggers keep in sync with the event table. Both annotate a relevance
+# rank where higher is better.
+def search_events(queryset, text):
+    vendor = connections[queryset.db].vendor
+    if vendor == "postgresql":
+        return _search_postgresql(queryset, text)
+    if vendor == "sqlite":
+        return _search_sqlite(queryset, text)
+
+    condition = Q()
+    for field in SEARCH_FIELDS:
+        condition |= Q(**{f"{field}__icontains": text})
+    return queryset.filter(condition).annotate(
+        rank=Value(0.0, output_field=FloatField())
+    )
+
+
+def search_vector():
+    # Must stay identical to the indexed expression for the index to be used
+    from django.contrib.postgres.search import SearchVector
+
+    return SearchVector(*SEARCH_FIELDS, config=SEARCH_CONFIG)
+
+
+def _search_postgresql(queryset, text):
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+    return (
+        queryset.alias(search=search_vector())
+        .filter(search=query)
+        .annotate(rank=SearchRank(search_vector(), query))
+    )
+
+
+def _search_sqlite(queryset, text):
+    # Every word is quoted so FTS5 operators in the input are taken literally
+    words = ['"{}"'.format(word.replace('"', '""')) for word in text.split()]
+    match = " ".join(words)
+    table = queryset.model._meta.db_table
+    # bm25() is lower for better matches
+    rank = RawSQL(
+        f"SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id",
+        [match],
+        output_field=FloatField(),
+    )
+    matches = RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]
+    )
+    return queryset.filter(pk__in=matches).annotate(rank=rank)
+
+
+def install_sqlite_search(connection, table="event_event"):
+    # Creates the FTS5 table and its triggers if missing and fills the index
+    # when they were. SQLite drops the triggers whenever a migration rebuilds
+    # the event table, so this runs again after every migrate.
+    columns = ", ".join(SEARCH_FIELDS)
+    new = ", ".join(f"new.{field}" for field in SEARCH_FIELDS)
+    old = ", ".join(f"old.{field}" for field in SEARCH_FIELDS)
+    insert = f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new});"
+    delete = (
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old});"
+    )
+    triggers = {
+        f"{FTS_TABLE}_insert": f"AFTER INSERT ON {table} BEGIN {insert} END",
+        f"{FTS_TABLE}_delete": f"AFTER DELETE ON {table} BEGIN {delete} END",
+        f"{FTS_TABLE}_update": (
+            f"AFTER UPDATE OF {columns} ON {table} BEGIN {delete} {insert} END"
+        ),
+    }
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+            [table],
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if existing.issuperset(triggers):
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"{columns}, content='{table}', content_rowid='id')"
+        )
+        for name, body in triggers.items():
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
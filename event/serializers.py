@@ -1,16 +1,143 @@
-from rest_framework import serializers
-from django.utils import timezone
-from .models import Event, Ticket
+from contextlib import contextmanager
+
 from django.db import transaction
+from django.db.models import F
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+from .booking import book_cart, book_tickets, check_bookable, hold_seats
+from .models import BookingClaim, BookingLedger, Event, SeatHold, Ticket
+
+
+@contextmanager
+def booking_errors():
+    # Errors from the atomic booking checks are reported the same way as
+    # the ones raised by validate()
+    try:
+        yield
+    except serializers.ValidationError as exc:
+        raise serializers.ValidationError(
+            {api_settings.NON_FIELD_ERRORS_KEY: exc.detail}
+        )
+
+
+class SparseFieldsetMixin:
+    # Serializes only the fields listed in ?fields= or those not listed in
+    # ?omit=, comma separated. The id is always included. Views load only
+    # the matching columns, see get_sparse_fields().
+
+    @classmethod
+    def get_sparse_fields(cls, request):
+        # The selected field names, or None when all of them are wanted
+        if request is None or request.method not in ("GET", "HEAD"):
+            return None
+        params = request.query_params
+        if "fields" not in params and "omit" not in params:
+            return None
+
+        available = list(cls().get_fields())
+        param = "fields" if "fields" in params else "omit"
+        names = {name.strip() for name in params[param].split(",") if name.strip()}
+        unknown = names.difference(available)
+        if unknown:
+            raise serializers.ValidationError(
+                {param: [f"Unknown fields: {', '.join(sorted(unknown))}."]}
+            )
+        if param == "fields":
+            return [name for name in available if name in names or name == "id"]
+        return [name for name in available if name not in names or name == "id"]
 
-from django.db.models import Sum
+    @classmethod
+    def sparse_queryset(cls, queryset, request, related=None, required=()):
+        # Loads only the columns of the selected fields, plus the required
+        # ones of the queryset's own model when the fields belong to a
+        # related model
+        selected = cls.get_sparse_fields(request)
+        if selected is None:
+            return queryset
+        prefix = f"{related}__" if related else ""
+        return queryset.only(*required, *(prefix + name for name in selected))
 
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.get_sparse_fields(self.context.get("request"))
+        if selected is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected}
 
-class EventSerializer(serializers.ModelSerializer):
+
+class EventSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Event
-        fields = "__all__"
+        exclude = ["booked_seats", "seats_updated_at"]
         read_only_fields = ["created_by"]
+        extra_kwargs = {
+            "max_seats": {"min_value": 1},
+            "max_tickets_per_user": {"min_value": 1},
+        }
+
+    def validate(self, attrs):
+        # Partial updates are checked against the event's current values
+        def value(name):
+            return attrs.get(name, getattr(self.instance, name, None))
+
+        errors = {}
+        if value("end_time") <= value("start_time"):
+            errors["end_time"] = "The event must end after it starts."
+        if value("booking_end") <= value("booking_start"):
+            errors["booking_end"] = "Booking must end after it starts."
+        elif value("booking_end") > value("start_time"):
+            errors["booking_end"] = "Booking must end before the event starts."
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+    def validate_max_seats(self, value):
+        # Seats that are already sold can't be taken away again
+        if self.instance and value < self.instance.booked_seats:
+            raise serializers.ValidationError(
+                f"{self.instance.booked_seats} seats are already booked for this event."
+            )
+        return value
+
+    def update(self, instance, validated_data):
+        if "max_seats" not in validated_data:
+            return super().update(instance, validated_data)
+        # Bookings made since validate_max_seats() may have sold more seats,
+        # so the new limit is only set while it still covers them. The row
+        # stays locked until the rest of the update is saved.
+        with transaction.atomic():
+            events = Event.objects.filter(pk=instance.pk)
+            max_seats = validated_data["max_seats"]
+            if not events.filter(booked_seats__lte=max_seats).update(
+                max_seats=max_seats
+            ):
+                booked = events.values_list("booked_seats", flat=True).first()
+                raise serializers.ValidationError(
+                    {"max_seats": f"{booked} seats are already booked for this event."}
+                )
+            return super().update(instance, validated_data)
+
+
+class EventListFilterSerializer(serializers.Serializer):
+    q = serializers.CharField(required=False, max_length=200)
+    event_type = serializers.ChoiceField(
+        choices=Event.EVENT_TYPE_CHOICES, required=False
+    )
+    location = serializers.CharField(required=False)
+    start_after = serializers.DateTimeField(required=False)
+    start_before = serializers.DateTimeField(required=False)
+    end_after = serializers.DateTimeField(required=False)
+    end_before = serializers.DateTimeField(required=False)
+    min_cost = serializers.DecimalField(max_digits=6, decimal_places=2, required=False)
+    max_cost = serializers.DecimalField(max_digits=6, decimal_places=2, required=False)
+    bookable = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, attrs):
+        if attrs.get("min_cost", 0) > attrs.get("max_cost", float("inf")):
+            raise serializers.ValidationError(
+                {"max_cost": "Must not be lower than min_cost."}
+            )
+        return attrs
 
 
 class TicketSerializer(serializers.ModelSerializer):
@@ -22,6 +149,31 @@ class TicketSerializer(serializers.ModelSerializer):
         read_only_fields = ["booking_time"]
 
 
+class CompactTicketSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Ticket
+        fields = "__all__"
+        read_only_fields = ["booking_time"]
+
+
+class TicketListFilterSerializer(serializers.Serializer):
+    when = serializers.ChoiceField(choices=["upcoming", "past"], required=False)
+    compact = serializers.BooleanField(required=False, default=False)
+
+
+class AttendeeExportFilterSerializer(serializers.Serializer):
+    # Resume an export after the last row received
+    after_booking_time = serializers.DateTimeField(required=False)
+    after_id = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if ("after_booking_time" in attrs) != ("after_id" in attrs):
+            raise serializers.ValidationError(
+                "after_booking_time and after_id must be given together."
+            )
+        return attrs
+
+
 class TicketCreateSerializer(serializers.ModelSerializer):
     event = serializers.PrimaryKeyRelatedField(queryset=Event.objects.all())
 
@@ -29,59 +181,76 @@ class TicketCreateSerializer(serializers.ModelSerializer):
         model = Ticket
         fields = "__all__"
         read_only_fields = ("user",)
+        extra_kwargs = {"quantity": {"min_value": 1}}
 
     def validate(self, attrs):
         event = attrs["event"]
-        user = self.context["request"].user
         quantity = attrs.get("quantity", 1)
 
-        # Check if the event's booking window is open
-        if not event.booking_start <= timezone.now() <= event.booking_end:
-            raise serializers.ValidationError(
-                "Booking window for this event is now closed."
+        check_bookable(event, quantity)
+        return attrs
+
+    def create(self, validated_data):
+        # The per-user total and seat availability are enforced atomically
+        # while booking
+        with booking_errors():
+            return book_tickets(
+                validated_data["user"],
+                validated_data["event"],
+                validated_data.get("quantity", 1),
             )
 
-        # Check if the user has already booked the maximum number of tickets
-        user_booked_tickets = (
-            Ticket.objects.filter(event=event, user=user).aggregate(
-                total=Sum("quantity")
-            )["total"]
-            or 0
-        )
 
-        # Check if user is trying to book more tickets than allowed per transaction
-        if quantity > event.max_tickets_per_user:
-            raise serializers.ValidationError(
-                f"You cannot book more than {event.max_tickets_per_user} tickets per user."
-            )
+class SeatHoldSerializer(serializers.ModelSerializer):
+    event = serializers.PrimaryKeyRelatedField(queryset=Event.objects.all())
+
+    class Meta:
+        model = SeatHold
+        exclude = ["user"]
+        read_only_fields = ["expires_at"]
+        extra_kwargs = {"quantity": {"min_value": 1}}
 
-        # Check if user's total tickets including this transaction exceed maximum allowed
-        if user_booked_tickets + quantity > event.max_tickets_per_user:
+    def validate(self, attrs):
+        event = attrs["event"]
+        if event.queued_booking:
             raise serializers.ValidationError(
-                f"You've already booked {user_booked_tickets} tickets. You cannot book more than {event.max_tickets_per_user} tickets in total for this event."
+                "This event only accepts single bookings.", code="queued_booking"
             )
+        check_bookable(event, attrs.get("quantity", 1))
+        return attrs
 
-        with transaction.atomic():
-            # Check if the event's max_seats has been reached
-            booked_seats = (
-                Ticket.objects.select_for_update()
-                .filter(event=event)
-                .aggregate(total=Sum("quantity"))["total"]
-                or 0
+    def create(self, validated_data):
+        with booking_errors():
+            return hold_seats(
+                validated_data["user"],
+                validated_data["event"],
+                validated_data.get("quantity", 1),
             )
-            if booked_seats + quantity > event.max_seats:
-                raise serializers.ValidationError(
-                    "No more seats available for this event."
-                )
 
-        return attrs
+
+class BookingClaimSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BookingClaim
+        exclude = ["user"]
+        read_only_fields = [
+            "event",
+            "quantity",
+            "status",
+            "ticket",
+            "reason",
+            "processed_at",
+        ]
 
 
 class EventSummarySerializer(serializers.ModelSerializer):
-    total_tickets_booked = serializers.SerializerMethodField()
-    unique_ticket_bookers = serializers.SerializerMethodField()
-    total_revenue = serializers.SerializerMethodField()
-    remaining_seats = serializers.SerializerMethodField()
+    total_tickets_booked = serializers.IntegerField(
+        source="stats.tickets_booked", read_only=True
+    )
+    unique_ticket_bookers = serializers.IntegerField(
+        source="stats.unique_bookers", read_only=True
+    )
+    total_revenue = serializers.FloatField(source="stats.revenue", read_only=True)
+    remaining_seats = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Event
@@ -96,14 +265,92 @@ class EventSummarySerializer(serializers.ModelSerializer):
             "ticket_cost",
         ]
 
-    def get_total_tickets_booked(self, obj):
-        return obj.tickets.count()
 
-    def get_unique_ticket_bookers(self, obj):
-        return obj.tickets.values_list("user", flat=True).distinct().count()
+class EventAvailabilitySerializer(serializers.ModelSerializer):
+    remaining_seats = serializers.IntegerField(read_only=True)
+    sold_out = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = Event
+        fields = [
+            "id",
+            "title",
+            "event_type",
+            "location",
+            "start_time",
+            "booking_end",
+            "ticket_cost",
+            "max_seats",
+            "max_tickets_per_user",
+            "remaining_seats",
+            "sold_out",
+        ]
+
+
+class EventSummaryFilterSerializer(serializers.Serializer):
+    ids = serializers.CharField(required=False)
+    created_by = serializers.ChoiceField(choices=["me"], required=False)
+    start_after = serializers.DateTimeField(required=False)
+    start_before = serializers.DateTimeField(required=False)
+
+    def validate_ids(self, value):
+        try:
+            return [int(pk) for pk in value.split(",") if pk.strip()]
+        except ValueError:
+            raise serializers.ValidationError(
+                "Expected a comma separated list of event ids."
+            )
+
+
+class CartItemSerializer(serializers.Serializer):
+    event = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class CartBookingSerializer(serializers.Serializer):
+    items = CartItemSerializer(many=True, allow_empty=False, write_only=True)
+    tickets = CompactTicketSerializer(many=True, read_only=True)
+
+    def validate_items(self, items):
+        event_ids = [item["event"] for item in items]
+        if len(set(event_ids)) != len(event_ids):
+            raise serializers.ValidationError("Each event can only be added once.")
+
+        # One query for the events and one for what the user already holds
+        user = self.context["request"].user
+        events = Event.objects.in_bulk(event_ids)
+        booked = dict(
+            BookingLedger.objects.filter(
+                user_id=user.pk, event_id__in=event_ids
+            ).values_list("event_id", F("quantity") + F("held"))
+        )
 
-    def get_total_revenue(self, obj):
-        return obj.tickets.count() * float(obj.ticket_cost)
+        errors = []
+        for item in items:
+            event = events.get(item["event"])
+            try:
+                if event is None:
+                    raise serializers.ValidationError(
+                        f'Invalid pk "{item["event"]}" - object does not exist.',
+                        code="does_not_exist",
+                    )
+                if event.queued_booking:
+                    raise serializers.ValidationError(
+                        "This event only accepts single bookings.",
+                        code="queued_booking",
+                    )
+                check_bookable(event, item["quantity"], booked.get(event.pk, 0))
+            except serializers.ValidationError as exc:
+                errors.append({"event": exc.detail})
+            else:
+                errors.append({})
+                item["event"] = event
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
 
-    def get_remaining_seats(self, obj):
-        return obj.max_seats - obj.tickets.count()
+    def create(self, validated_data):
+        items = [(item["event"], item["quantity"]) for item in validated_data["items"]]
+        with booking_errors():
+            tickets = book_cart(validated_data["user"], items)
+        return {"tickets": tickets}
@@ -0,0 +1,192 @@
+# Query budgets of the API endpoints.
+#
+# Views declare a query_budget, the most database queries a full response may
+# take. Every endpoint is called against datasets of growing size and must
+# make the same number of queries each time, within its budget, so a query
+# per row such as a lazily loaded event per ticket fails here instead of in
+# production. Cached and not modified responses take fewer queries, the
+# caches are cleared before every call. At runtime MetricsMiddleware logs
+# requests over their budget.
+
+import logging
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from users.authentication import UserRefreshToken
+from users.views import UserLoginView
+
+from .models import Event, EventStats, Ticket
+from .views import EventListView, EventSummaryView, TicketCreateView, TicketListView
+
+User = get_user_model()
+
+SIZES = [1, 10, 1000]
+
+
+def client_for(user):
+    client = APIClient()
+    token = UserRefreshToken.for_user(user)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    return client
+
+
+def new_events(count, created_by):
+    # Created with their stats, like Event.save() and the bulk import do
+    now = timezone.now()
+    events = Event.objects.bulk_create(
+        Event(
+            title=f"Event {i}",
+            description="Seeded event",
+            location="Hall",
+            start_time=now + timezone.timedelta(days=2),
+            end_time=now + timezone.timedelta(days=2, hours=2),
+            max_seats=100000,
+            max_tickets_per_user=100000,
+            ticket_cost=10,
+            booking_start=now - timezone.timedelta(days=1),
+            booking_end=now + timezone.timedelta(days=1),
+            created_by=created_by,
+        )
+        for i in range(count)
+    )
+    EventStats.objects.bulk_create(EventStats(event=event) for event in events)
+    return events
+
+
+def new_users(count, prefix):
+    start = User.objects.filter(username__startswith=prefix).count()
+    return User.objects.bulk_create(
+        User(username=f"{prefix}{i}") for i in range(start, start + count)
+    )
+
+
+def query_counts(grow, call):
+    # The queries of call() once the dataset has grown to each size
+    counts = {}
+    for size in SIZES:
+        grow(size)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = call()
+        assert response.status_code < 400, response.content
+        counts[size] = len(queries)
+    return counts
+
+
+def assert_within_budget(view, grow, call):
+    counts = query_counts(grow, call)
+    assert len(set(counts.values())) == 1, f"queries grow with the data: {counts}"
+    assert counts[SIZES[0]] <= view.query_budget, counts
+
+
+@pytest.fixture
+def admin(db):
+    return User.objects.create_user(
+        username="admin", password="password", user_type="admin"
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("params", [{}, {"q": "event"}, {"bookable": "true"}])
+def test_event_list_budget(admin, params):
+    def grow(size):
+        new_events(size - Event.objects.count(), admin)
+
+    assert_within_budget(
+        EventListView, grow, lambda: APIClient().get(reverse("event-list"), params)
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("params", [{}, {"when": "upcoming"}, {"compact": "true"}])
+def test_ticket_list_budget(admin, params):
+    user = new_users(1, "booker")[0]
+
+    def grow(size):
+        events = new_events(size - Ticket.objects.count(), admin)
+        Ticket.objects.bulk_create(Ticket(user=user, event=event) for event in events)
+
+    client = client_for(user)
+    assert_within_budget(
+        TicketListView, grow, lambda: client.get(reverse("ticket-list"), params)
+    )
+
+
+@pytest.mark.django_db
+def test_event_summary_budget(admin):
+    event = new_events(1, admin)[0]
+
+    def grow(size):
+        users = new_users(size - Ticket.objects.count(), "booker")
+        Ticket.objects.bulk_create(Ticket(user=user, event=event) for user in users)
+        # Events older than their stats get them rebuilt, the costliest case
+        EventStats.objects.all().delete()
+
+    client = client_for(admin)
+    assert_within_budget(
+        EventSummaryView,
+        grow,
+        lambda: client.get(reverse("event-summary", kwargs={"pk": event.pk})),
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("repeat", [False, True])
+@pytest.mark.parametrize("headers", [{}, {"HTTP_IDEMPOTENCY_KEY": "booking"}])
+def test_ticket_create_budget(admin, repeat, headers):
+    event = new_events(1, admin)[0]
+
+    clients = []
+
+    def grow(size):
+        users = new_users(size - Ticket.objects.count(), "booker")
+        Ticket.objects.bulk_create(Ticket(user=user, event=event) for user in users)
+        # A new user every time, so every call is a first booking or the
+        # user's second one
+        clients.append(client_for(new_users(1, "buyer")[0]))
+        if repeat:
+            clients[-1].post(reverse("ticket-create"), {"event": event.pk})
+
+    assert_within_budget(
+        TicketCreateView,
+        grow,
+        lambda: clients[-1].post(
+            reverse("ticket-create"), {"event": event.pk}, **headers
+        ),
+    )
+
+
+@pytest.mark.django_db
+def test_login_budget():
+    password = make_password("password")
+
+    def grow(size):
+        User.objects.bulk_create(
+            User(username=f"user{i}", password=password)
+            for i in range(User.objects.count(), size)
+        )
+
+    assert_within_budget(
+        UserLoginView,
+        grow,
+        lambda: APIClient().post(
+            reverse("login"), {"username": "user0", "password": "password"}
+        ),
+    )
+
+
+@pytest.mark.django_db
+def test_query_budget_violations_are_logged(admin, caplog, monkeypatch):
+    monkeypatch.setattr(EventListView, "query_budget", 0)
+    new_events(1, admin)
+    with caplog.at_level(logging.WARNING, logger="utils.middleware"):
+        APIClient().get(reverse("event-list"))
+    assert "GET /events/ made" in caplog.text
@@ -0,0 +1,160 @@
+# Query plan regressions for the booking and catalogue endpoints.
+#
+# Every endpoint is called against a seeded dataset while its queries are
+# recorded, then each query touching the ticket table is run through EXPLAIN.
+# A full scan of event_ticket fails the test, since that table grows with
+# every booking. On PostgreSQL sequential scans are disabled for the check,
+# so a small test table doesn't make the planner prefer one over an index
+# that exists.
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from users.authentication import UserRefreshToken
+
+from .booking import hold_seats
+from .models import Event, EventStats, Ticket
+
+User = get_user_model()
+
+TICKET_TABLE = Ticket._meta.db_table
+
+
+@pytest.fixture
+def dataset(db):
+    now = timezone.now()
+    admin = User.objects.create_user(
+        username="admin", password="password", user_type="admin"
+    )
+    users = User.objects.bulk_create(User(username=f"user{i}") for i in range(20))
+    events = Event.objects.bulk_create(
+        Event(
+            title=f"Event {i}",
+            description="Seeded event",
+            location="Hall",
+            start_time=now + timezone.timedelta(days=i - 10),
+            end_time=now + timezone.timedelta(days=i - 10, hours=2),
+            max_seats=1000,
+            max_tickets_per_user=50,
+            ticket_cost=10,
+            booking_start=now - timezone.timedelta(days=30),
+            booking_end=now + timezone.timedelta(days=i - 11),
+            booked_seats=20,
+            created_by=admin,
+        )
+        for i in range(30)
+    )
+    Ticket.objects.bulk_create(
+        Ticket(user=user, event=event) for event in events for user in users
+    )
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    return {"admin": admin, "user": users[0], "event": events[-1]}
+
+
+def client_for(user):
+    client = APIClient()
+    token = UserRefreshToken.for_user(user)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    return client
+
+
+def ticket_queries(call):
+    # Records the (sql, params) of every statement reading the ticket table
+    queries = []
+
+    def record(execute, sql, params, many, context):
+        if TICKET_TABLE in sql and sql.lstrip().upper().startswith("SELECT"):
+            queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        response = call()
+    assert response.status_code < 400, response.content
+    assert queries, "the endpoint didn't query the ticket table"
+    return queries
+
+
+def full_ticket_scans(sql, params):
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {sql}", params)
+            plan = [row[0] for row in cursor.fetchall()]
+            return [line for line in plan if f"Seq Scan on {TICKET_TABLE}" in line]
+
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        plan = [row[-1] for row in cursor.fetchall()]
+        # SEARCH uses an index to find rows, a SCAN reads the whole table
+        # or index
+        return [line for line in plan if line.startswith(f"SCAN {TICKET_TABLE}")]
+
+
+def assert_no_full_ticket_scans(call):
+    for sql, params in ticket_queries(call):
+        assert full_ticket_scans(sql, params) == [], sql
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "params", [{}, {"when": "upcoming"}, {"when": "past"}, {"compact": "true"}]
+)
+def test_ticket_list_plans(dataset, params):
+    client = client_for(dataset["user"])
+    for name in ["ticket-list", "async-ticket-list"]:
+        assert_no_full_ticket_scans(lambda: client.get(reverse(name), params))
+
+
+@pytest.mark.django_db
+def test_event_summary_plans(dataset):
+    client = client_for(dataset["admin"])
+    event = dataset["event"]
+    # Without stats the summaries are rebuilt from the tickets
+    EventStats.objects.all().delete()
+    assert_no_full_ticket_scans(
+        lambda: client.get(reverse("event-summary", kwargs={"pk": event.pk}))
+    )
+    EventStats.objects.all().delete()
+    assert_no_full_ticket_scans(
+        lambda: client.get(reverse("event-summary-list"), {"ids": str(event.pk)})
+    )
+
+
+@pytest.mark.django_db
+def test_attendee_export_plans(dataset):
+    client = client_for(dataset["admin"])
+    event = dataset["event"]
+    url = reverse("event-attendees-ndjson", kwargs={"pk": event.pk})
+    ticket = Ticket.objects.filter(event=event).order_by("booking_time", "id")[5]
+
+    for params in [
+        {},
+        {"after_booking_time": ticket.booking_time, "after_id": ticket.id},
+    ]:
+
+        def export():
+            response = client.get(url, params)
+            b"".join(response.streaming_content)
+            return response
+
+        assert_no_full_ticket_scans(export)
+
+
+@pytest.mark.django_db
+def test_booking_plans(dataset):
+    client = client_for(dataset["user"])
+    event = dataset["event"]
+    # Stats are rebuilt from the tickets by bookings that find none
+    assert_no_full_ticket_scans(
+        lambda: client.post(reverse("ticket-create"), {"event": event.pk})
+    )
+
+    hold = hold_seats(dataset["user"], event, 1)
+    EventStats.objects.all().delete()
+    assert_no_full_ticket_scans(
+        lambda: client.post(reverse("seat-hold-confirm", kwargs={"pk": hold.pk}))
+    )
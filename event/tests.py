@@ -1,14 +1,39 @@
+import gzip
+import io
+import json
+
+import brotli
 import pytest
 
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APIClient
 from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_201_CREATED
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import Event, Ticket
+from users.authentication import UserRefreshToken
+from utils import metrics
+from utils.middleware import _record_query
+
+from .booking import book_tickets, confirm_hold, hold_seats
+from .serializers import EventSerializer
+from .models import (
+    BookingClaim,
+    BookingLedger,
+    Event,
+    EventStats,
+    SeatHold,
+    Ticket,
+)
 
 User = get_user_model()
 
@@ -18,6 +43,11 @@ def api_client():
     return APIClient()
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
 @pytest.fixture
 def create_user(db):
     user = User.objects.create(
@@ -53,6 +83,26 @@ def create_event(db, create_admin):
     return event
 
 
+@pytest.fixture
+def create_open_event(db, create_admin):
+    now = timezone.now()
+    event = Event.objects.create(
+        event_type="offline",
+        title="Open Event",
+        description="This event is open for booking",
+        location="Hall A",
+        start_time=now + timezone.timedelta(days=10),
+        end_time=now + timezone.timedelta(days=10, hours=2),
+        max_seats=3,
+        max_tickets_per_user=2,
+        ticket_cost=15.00,
+        booking_start=now - timezone.timedelta(days=1),
+        booking_end=now + timezone.timedelta(days=5),
+        created_by=create_admin,
+    )
+    return event
+
+
 @pytest.fixture
 def create_ticket(db, create_user, create_event):
     ticket = Ticket.objects.create(
@@ -67,7 +117,7 @@ def create_ticket(db, create_user, create_event):
 def test_event_list_view(api_client, create_event):
     response = api_client.get(reverse("event-list"))
     assert response.status_code == 200
-    assert len(response.json()) == 1
+    assert len(response.json()["results"]) == 1
 
 
 @pytest.mark.django_db
@@ -90,6 +140,8 @@ def test_event_create_view(api_client, create_admin):
     response = api_client.post(reverse("event-create"), event_data)
     assert response.status_code == 201
     assert response.json()["title"] == event_data["title"]
+    # Bookings and summaries find the stats of new events
+    assert EventStats.objects.get(event_id=response.json()["id"]).bookings == 0
 
 
 @pytest.mark.django_db
@@ -141,3 +193,907 @@ def test_booking_time_validation(api_client, create_user, create_event):
     }
     response = api_client.post(reverse("ticket-create"), ticket_data)
     assert response.status_code == HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_booking_updates_seat_counter(api_client, create_user, create_open_event):
+    token = RefreshToken.for_user(create_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    response = api_client.post(
+        reverse("ticket-create"), {"event": create_open_event.id, "quantity": 2}
+    )
+    assert response.status_code == HTTP_201_CREATED
+    create_open_event.refresh_from_db()
+    assert create_open_event.booked_seats == 2
+    assert create_open_event.remaining_seats == 1
+
+
+@pytest.mark.django_db
+def test_event_update_keeps_concurrent_bookings(create_user, create_open_event):
+    serializer = EventSerializer(
+        create_open_event, data={"title": "Renamed Event"}, partial=True
+    )
+    assert serializer.is_valid()
+    # Booked after the event was loaded for the update
+    book_tickets(create_user, Event.objects.get(pk=create_open_event.pk), 2)
+    serializer.save()
+
+    create_open_event.refresh_from_db()
+    assert create_open_event.title == "Renamed Event"
+    assert create_open_event.booked_seats == 2
+
+
+@pytest.mark.django_db
+def test_event_update_rejects_max_seats_below_new_bookings(
+    create_user, create_open_event
+):
+    serializer = EventSerializer(create_open_event, data={"max_seats": 1}, partial=True)
+    assert serializer.is_valid()
+    book_tickets(create_user, Event.objects.get(pk=create_open_event.pk), 2)
+    with pytest.raises(ValidationError) as exc:
+        serializer.save()
+
+    assert "2 seats are already booked" in str(exc.value.detail["max_seats"])
+    create_open_event.refresh_from_db()
+    assert create_open_event.max_seats == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_booked_seats_migration_handles_oversold_events(caplog, create_admin):
+    def migrate(target):
+        executor = MigrationExecutor(connection)
+        executor.migrate([target or executor.loader.graph.leaf_nodes("event")[0]])
+        return executor.loader.project_state([target]).apps if target else None
+
+    apps = migrate(("event", "0004_ticket_quantity"))
+    try:
+        now = timezone.now()
+        event = apps.get_model("event", "Event").objects.create(
+            title="Oversold Event",
+            description="Sold before seats were counted",
+            location="Hall A",
+            start_time=now,
+            end_time=now + timezone.timedelta(hours=2),
+            max_seats=2,
+            ticket_cost=10,
+            booking_start=now - timezone.timedelta(days=1),
+            booking_end=now,
+            created_by_id=create_admin.pk,
+        )
+        apps.get_model("event", "Ticket").objects.create(
+            user_id=create_admin.pk, event_id=event.pk, quantity=3
+        )
+        migrate(("event", "0005_event_booked_seats"))
+    finally:
+        migrate(None)
+
+    event = Event.objects.get(pk=event.pk)
+    assert (event.booked_seats, event.max_seats) == (3, 3)
+    assert f"Event {event.pk} was oversold" in caplog.text
+
+
+@pytest.mark.django_db
+def test_book_tickets_rejects_stale_availability(create_user, create_open_event):
+    # Another booking took the last seats after this event row was loaded
+    Event.objects.filter(pk=create_open_event.pk).update(booked_seats=3)
+    with pytest.raises(ValidationError):
+        book_tickets(create_user, create_open_event, 1)
+    assert not Ticket.objects.filter(event=create_open_event).exists()
+
+
+@pytest.mark.django_db
+def test_booking_ledger_enforces_per_user_total(
+    api_client, create_user, create_open_event
+):
+    token = RefreshToken.for_user(create_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    url = reverse("ticket-create")
+    assert api_client.post(url, {"event": create_open_event.id}).status_code == 201
+    assert api_client.post(url, {"event": create_open_event.id}).status_code == 201
+
+    response = api_client.post(url, {"event": create_open_event.id})
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    assert "already booked 2 tickets" in response.json()["non_field_errors"][0]
+    ledger = BookingLedger.objects.get(user=create_user, event=create_open_event)
+    assert ledger.quantity == 2
+    create_open_event.refresh_from_db()
+    assert create_open_event.booked_seats == 2
+
+
+@pytest.mark.django_db
+def test_event_summary_counts_quantities(
+    api_client, create_user, create_admin, create_open_event
+):
+    book_tickets(create_user, create_open_event, 2)
+    book_tickets(create_admin, create_open_event, 1)
+
+    token = RefreshToken.for_user(create_admin)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    response = api_client.get(
+        reverse("event-summary", kwargs={"pk": create_open_event.id})
+    )
+    assert response.status_code == 200
+    summary = response.json()
+    assert summary["total_tickets_booked"] == 3
+    assert summary["unique_ticket_bookers"] == 2
+    assert summary["total_revenue"] == 45.0
+    assert summary["remaining_seats"] == 0
+
+
+@pytest.mark.django_db
+def test_event_summary_rebuilds_missing_stats(
+    api_client, create_admin, create_event, create_ticket
+):
+    EventStats.objects.filter(event=create_event).delete()
+    token = RefreshToken.for_user(create_admin)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    response = api_client.get(reverse("event-summary", kwargs={"pk": create_event.id}))
+    assert response.status_code == 200
+    assert response.json()["total_tickets_booked"] == 1
+    assert EventStats.objects.get(event=create_event).revenue == 20
+
+
+@pytest.mark.django_db
+def test_event_summary_list_view(
+    api_client,
+    django_assert_max_num_queries,
+    create_user,
+    create_admin,
+    create_event,
+    create_open_event,
+):
+    book_tickets(create_user, create_open_event, 2)
+    token = RefreshToken.for_user(create_admin)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    with django_assert_max_num_queries(5):
+        response = api_client.get(
+            reverse("event-summary-list"),
+            {"ids": f"{create_event.id},{create_open_event.id}", "created_by": "me"},
+        )
+    assert response.status_code == 200
+    assert response.json()["count"] == 2
+    summaries = {row["id"]: row for row in response.json()["results"]}
+    assert summaries[create_event.id]["total_tickets_booked"] == 0
+    assert summaries[create_open_event.id]["total_tickets_booked"] == 2
+    assert summaries[create_open_event.id]["remaining_seats"] == 1
+
+
+@pytest.mark.django_db
+def test_event_list_cursor_pagination(api_client, create_event, create_open_event):
+    # Same start_time as create_event, so the id decides the order
+    tied_event = Event.objects.get(pk=create_event.pk)
+    tied_event.pk = None
+    tied_event.save()
+
+    response = api_client.get(reverse("event-list"), {"page_size": 2})
+    page = response.json()
+    assert [event["id"] for event in page["results"]] == [
+        create_event.id,
+        tied_event.id,
+    ]
+
+    page = api_client.get(page["next"]).json()
+    assert [event["id"] for event in page["results"]] == [create_open_event.id]
+    assert page["next"] is None
+
+    response = api_client.get(reverse("event-list"), {"cursor": "garbage"})
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_ticket_list_view(
+    api_client,
+    django_assert_max_num_queries,
+    create_user,
+    create_event,
+    create_open_event,
+):
+    Ticket.objects.create(user=create_user, event=create_event)
+    Ticket.objects.create(user=create_user, event=create_open_event)
+    Ticket.objects.create(user=create_user, event=create_open_event)
+    token = RefreshToken.for_user(create_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    with django_assert_max_num_queries(3):
+        response = api_client.get(reverse("ticket-list"))
+    assert len(response.json()["results"]) == 3
+    assert response.json()["results"][0]["event"]["id"] == create_open_event.id
+
+    response = api_client.get(reverse("ticket-list"), {"when": "upcoming"})
+    assert len(response.json()["results"]) == 2
+
+    response = api_client.get(reverse("ticket-list"), {"compact": "true"})
+    page = response.json()
+    assert [ticket["event"] for ticket in page["results"]] == [
+        create_open_event.id,
+        create_open_event.id,
+        create_event.id,
+    ]
+    assert set(page["events"]) == {str(create_event.id), str(create_open_event.id)}
+
+
+@pytest.mark.django_db
+def test_event_reads_are_cached_until_a_write(
+    api_client,
+    django_assert_num_queries,
+    django_capture_on_commit_callbacks,
+    create_admin,
+    create_event,
+):
+    detail_url = reverse("event-detail", kwargs={"pk": create_event.id})
+    assert api_client.get(reverse("event-list")).status_code == 200
+    assert api_client.get(detail_url).status_code == 200
+    # Only the detail's ETag lookup reaches the database
+    with django_assert_num_queries(1):
+        assert len(api_client.get(reverse("event-list")).json()["results"]) == 1
+        assert api_client.get(detail_url).json()["title"] == "Test Event"
+
+    token = RefreshToken.for_user(create_admin)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.patch(
+            reverse("event-update", kwargs={"pk": create_event.id}),
+            {"title": "Renamed Event"},
+        )
+    assert response.status_code == 200
+
+    response = api_client.get(reverse("event-list"))
+    assert response.json()["results"][0]["title"] == "Renamed Event"
+    assert api_client.get(detail_url).json()["title"] == "Renamed Event"
+
+
+@pytest.mark.django_db
+def test_model_writes_invalidate_cached_reads(
+    api_client, django_capture_on_commit_callbacks, create_event
+):
+    detail_url = reverse("event-detail", kwargs={"pk": create_event.id})
+    assert api_client.get(detail_url).json()["title"] == "Test Event"
+
+    # Like a save from the admin or the shell
+    create_event.title = "Renamed Event"
+    with django_capture_on_commit_callbacks(execute=True):
+        create_event.save()
+    assert api_client.get(detail_url).json()["title"] == "Renamed Event"
+    assert len(api_client.get(reverse("event-list")).json()["results"]) == 1
+
+    with django_capture_on_commit_callbacks(execute=True):
+        create_event.delete()
+    assert api_client.get(detail_url).status_code == 404
+    assert api_client.get(reverse("event-list")).json()["results"] == []
+
+
+@pytest.mark.django_db
+def test_ticket_deletes_release_seats(create_user, create_open_event):
+    other = User.objects.create_user(username="otheruser", password="testpassword")
+    ticket = book_tickets(create_user, create_open_event, 2)
+    book_tickets(other, create_open_event, 1)
+
+    # Like a delete from the admin
+    ticket.delete()
+    create_open_event.refresh_from_db()
+    assert create_open_event.booked_seats == 1
+    assert BookingLedger.objects.get(user=create_user).quantity == 0
+    stats = EventStats.objects.get(event=create_open_event)
+    assert (stats.bookings, stats.tickets_booked, stats.unique_bookers) == (1, 1, 1)
+    # The seats can be booked again, up to the user limit
+    book_tickets(create_user, create_open_event, 2)
+
+    # Cascading from the user
+    other.delete()
+    create_open_event.refresh_from_db()
+    assert create_open_event.booked_seats == 2
+    assert EventStats.objects.get(event=create_open_event).unique_bookers == 1
+
+
+@pytest.mark.django_db
+def test_booking_invalidates_cached_summary(
+    api_client,
+    django_capture_on_commit_callbacks,
+    create_user,
+    create_admin,
+    create_open_event,
+):
+    token = RefreshToken.for_user(create_admin)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    url = reverse("event-summary", kwargs={"pk": create_open_event.id})
+    assert api_client.get(url).json()["total_tickets_booked"] == 0
+
+    with django_capture_on_commit_callbacks(execute=True):
+        book_tickets(create_user, create_open_event, 2)
+    assert api_client.get(url).json()["total_tickets_booked"] == 2
+
+
+@pytest.mark.django_db
+def test_event_endpoints_support_conditional_get(
+    api_client, create_user, create_admin, create_open_event
+):
+    for url in [
+        reverse("event-list"),
+        reverse("event-detail", kwargs={"pk": create_open_event.id}),
+    ]:
+        response = api_client.get(url)
+        assert response.status_code == 200
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        assert response.status_code == 304
+    detail = api_client.get(
+        reverse("event-detail", kwargs={"pk": create_open_event.id})
+    )
+    assert detail.has_header("Last-Modified")
+
+    token = RefreshToken.for_user(create_admin)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    url = reverse("event-summary", kwargs={"pk": create_open_event.id})
+    etag = api_client.get(url)["ETag"]
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    # A booking changes availability without touching the event itself
+    book_tickets(create_user, create_open_event, 1)
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+@pytest.mark.django_db
+def test_event_list_etag_follows_the_catalogue_version(
+    api_client,
+    django_assert_num_queries,
+    django_capture_on_commit_callbacks,
+    create_event,
+    create_open_event,
+):
+    urls = [reverse("event-list"), reverse("async-event-list")]
+    etags = [api_client.get(url)["ETag"] for url in urls]
+    for url, etag in zip(urls, etags):
+        with django_assert_num_queries(0):
+            response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+
+    # A delete touches no remaining row
+    with django_capture_on_commit_callbacks(execute=True):
+        Event.objects.filter(pk=create_event.pk).delete()
+    for url, etag in zip(urls, etags):
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert len(response.json()["results"]) == 1
+
+
+@pytest.mark.django_db
+def test_ticket_lists_by_time_are_not_validated(
+    api_client, create_user, create_open_event
+):
+    book_tickets(create_user, create_open_event, 1)
+    token = UserRefreshToken.for_user(create_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    for name in ["ticket-list", "async-ticket-list"]:
+        assert api_client.get(reverse(name)).has_header("ETag")
+        # Events move from upcoming to past without any row changing
+        response = api_client.get(reverse(name), {"when": "upcoming"})
+        assert len(response.json()["results"]) == 1
+        assert not response.has_header("ETag")
+
+
+@pytest.mark.django_db
+def test_confirmed_hold_changes_summary_etag(
+    api_client,
+    create_user,
+    create_admin,
+    create_open_event,
+    django_capture_on_commit_callbacks,
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        hold = hold_seats(create_user, create_open_event, 2)
+    token = RefreshToken.for_user(create_admin)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    url = reverse("event-summary", kwargs={"pk": create_open_event.id})
+    response = api_client.get(url)
+    assert response.json()["total_tickets_booked"] == 0
+
+    # Confirming books the held seats without changing booked_seats
+    with django_capture_on_commit_callbacks(execute=True):
+        confirm_hold(create_user, hold.pk)
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+    assert response.status_code == 200
+    assert response.json()["total_tickets_booked"] == 2
+
+
+@pytest.mark.django_db
+def test_cart_booking_is_all_or_nothing(
+    api_client, create_user, create_event, create_open_event
+):
+    token = RefreshToken.for_user(create_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    second_event = Event.objects.get(pk=create_open_event.pk)
+    second_event.pk = None
+    second_event.save()
+
+    # The booking window of create_event is closed
+    response = api_client.post(
+        reverse("ticket-cart"),
+        {
+            "items": [
+                {"event": create_open_event.id, "quantity": 2},
+                {"event": create_event.id},
+            ]
+        },
+        format="json",
+    )
+    assert response.status_code == HTTP_400_BAD_REQUEST
+    assert response.json()["items"][0] == {}
+    assert not Ticket.objects.exists()
+
+    response = api_client.post(
+        reverse("ticket-cart"),
+        {
+            "items": [
+                {"event": second_event.id},
+                {"event": create_open_event.id, "quantity": 2},
+            ]
+        },
+        format="json",
+    )
+    assert response.status_code == HTTP_201_CREATED
+    assert len(response.json()["tickets"]) == 2
+    create_open_event.refresh_from_db()
+    second_event.refresh_from_db()
+    assert create_open_event.booked_seats == 2
+    assert second_event.booked_seats == 1
+
+
+@pytest.mark.django_db
+def test_queued_booking_claims(
+    api_client, create_user, create_admin, create_open_event
+):
+    create_open_event.queued_booking = True
+    create_open_event.save()
+    BookingClaim.objects.create(user=create_admin, event=create_open_event, quantity=2)
+
+    token = RefreshToken.for_user(create_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    response = api_client.post(
+        reverse("ticket-create"), {"event": create_open_event.id, "quantity": 2}
+    )
+    assert response.status_code == 202
+    claim_url = reverse("booking-claim", kwargs={"pk": response.json()["id"]})
+    assert api_client.get(claim_url).json()["status"] == "pending"
+    assert not Ticket.objects.exists()
+
+    call_command("process_booking_queue", stdout=io.StringIO())
+
+    # The earlier claim took two of the three seats
+    claim = api_client.get(claim_url).json()
+    assert claim["status"] == "rejected"
+    assert claim["reason"] == "No more seats available for this event."
+    admin_claim = BookingClaim.objects.get(user=create_admin)
+    assert admin_claim.status == "booked"
+    assert admin_claim.ticket.quantity == 2
+
+
+@pytest.mark.django_db
+def test_seat_hold_confirm(api_client, create_user, create_open_event):
+    token = RefreshToken.for_user(create_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    response = api_client.post(
+        reverse("seat-hold-create"), {"event": create_open_event.id, "quantity": 2}
+    )
+    assert response.status_code == HTTP_201_CREATED
+    hold_id = response.json()["id"]
+
+    # Held seats count against the per-user limit
+    response = api_client.post(
+        reverse("ticket-create"), {"event": create_open_event.id}
+    )
+    assert response.status_code == HTTP_400_BAD_REQUEST
+
+    response = api_client.post(reverse("seat-hold-confirm", kwargs={"pk": hold_id}))
+    assert response.status_code == HTTP_201_CREATED
+    assert response.json()["quantity"] == 2
+    assert not SeatHold.objects.exists()
+    ledger = BookingLedger.objects.get(user=create_user, event=create_open_event)
+    assert (ledger.quantity, ledger.held) == (2, 0)
+    assert EventStats.objects.get(event=create_open_event).unique_bookers == 1
+    create_open_event.refresh_from_db()
+    assert create_open_event.booked_seats == 2
+
+
+@pytest.mark.django_db
+def test_expired_seat_holds_are_released(
+    api_client, create_user, create_admin, create_open_event
+):
+    hold = hold_seats(create_user, create_open_event, 2)
+    hold_seats(create_admin, create_open_event, 1)
+    create_open_event.refresh_from_db()
+    assert create_open_event.remaining_seats == 0
+
+    SeatHold.objects.filter(pk=hold.pk).update(expires_at=timezone.now())
+    call_command("release_expired_holds", stdout=io.StringIO())
+
+    create_open_event.refresh_from_db()
+    assert create_open_event.remaining_seats == 2
+    ledger = BookingLedger.objects.get(user=create_user, event=create_open_event)
+    assert ledger.held == 0
+
+    token = RefreshToken.for_user(create_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    response = api_client.post(reverse("seat-hold-confirm", kwargs={"pk": hold.pk}))
+    assert response.status_code == HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_ticket_create_idempotency_key(api_client, create_user, create_open_event):
+    token = RefreshToken.for_user(create_user)
+    api_client.credentials(
+        HTTP_AUTHORIZATION=f"Bearer {token.access_token}",
+        HTTP_IDEMPOTENCY_KEY="booking-1",
+    )
+    url = reverse("ticket-create")
+    first = api_client.post(url, {"event": create_open_event.id})
+    assert first.status_code == HTTP_201_CREATED
+
+    retry = api_client.post(url, {"event": create_open_event.id})
+    assert retry.status_code == HTTP_201_CREATED
+    assert retry.json() == first.json()
+    assert retry["Idempotent-Replayed"] == "true"
+    assert Ticket.objects.count() == 1
+
+    response = api_client.post(url, {"event": create_open_event.id, "quantity": 2})
+    assert response.status_code == 422
+
+
+@pytest.mark.django_db
+def test_booking_with_role_claims_token(api_client, create_user, create_open_event):
+    token = UserRefreshToken.for_user(create_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    response = api_client.post(
+        reverse("ticket-create"), {"event": create_open_event.id}
+    )
+    assert response.status_code == HTTP_201_CREATED
+    assert Ticket.objects.get().user == create_user
+
+    response = api_client.get(reverse("ticket-list"))
+    assert len(response.json()["results"]) == 1
+
+
+@pytest.mark.django_db
+def test_async_read_views_match_sync_views(
+    api_client, create_user, create_admin, create_event, create_open_event
+):
+    book_tickets(create_user, create_open_event, 1)
+    for sync_url, async_url in [
+        (reverse("event-list"), reverse("async-event-list")),
+        (
+            reverse("event-detail", kwargs={"pk": create_event.id}),
+            reverse("async-event-detail", kwargs={"pk": create_event.id}),
+        ),
+    ]:
+        response = api_client.get(async_url)
+        assert response.status_code == 200
+        assert response.json() == api_client.get(sync_url).json()
+        response = api_client.get(async_url, HTTP_IF_NONE_MATCH=response["ETag"])
+        assert response.status_code == 304
+    assert (
+        api_client.get(reverse("async-event-detail", kwargs={"pk": 0})).status_code
+        == 404
+    )
+
+    url = reverse("async-event-summary", kwargs={"pk": create_open_event.id})
+    assert api_client.get(url).status_code == 401
+    token = UserRefreshToken.for_user(create_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    assert api_client.get(url).status_code == 403
+    response = api_client.get(reverse("async-ticket-list"), {"compact": "true"})
+    assert (
+        response.json()
+        == api_client.get(reverse("ticket-list"), {"compact": "true"}).json()
+    )
+
+    token = UserRefreshToken.for_user(create_admin)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    assert api_client.get(url).json()["total_tickets_booked"] == 1
+
+
+@pytest.mark.django_db
+def test_event_list_filters(api_client, create_event, create_open_event):
+    url = reverse("event-list")
+
+    def ids(params):
+        response = api_client.get(url, params)
+        assert response.status_code == 200, response.json()
+        return [event["id"] for event in response.json()["results"]]
+
+    assert ids({"event_type": "offline"}) == [create_open_event.id]
+    assert ids({"location": "hall"}) == [create_open_event.id]
+    assert ids({"bookable": "true"}) == [create_open_event.id]
+    assert ids({"start_before": "2024-01-01T00:00Z"}) == [create_event.id]
+    assert ids({"min_cost": "10", "max_cost": "16"}) == [create_open_event.id]
+    assert api_client.get(url, {"min_cost": "20", "max_cost": "10"}).status_code == 400
+
+    Event.objects.filter(pk=create_open_event.pk).update(booked_seats=F("max_seats"))
+    assert ids({"bookable": "true"}) == []
+
+
+@pytest.mark.django_db
+def test_event_list_search(api_client, create_admin, create_event, create_open_event):
+    for title in ["Jazz night", "Jazz and blues night", "Rock night"]:
+        Event.objects.create(
+            **{
+                field.name: getattr(create_event, field.name)
+                for field in Event._meta.concrete_fields
+                if field.name not in ("id", "title")
+            },
+            title=title,
+        )
+    url = reverse("event-list")
+    response = api_client.get(url, {"q": "jazz", "page_size": 1})
+    page = response.json()
+    assert page["results"][0]["title"] in ["Jazz night", "Jazz and blues night"]
+    page = api_client.get(page["next"]).json()
+    assert page["results"][0]["title"] in ["Jazz night", "Jazz and blues night"]
+    assert page["next"] is None
+
+    # The index follows updates and quotes don't break the query
+    Event.objects.filter(title="Rock night").update(title="Punk night")
+    titles = [
+        e["title"] for e in api_client.get(url, {"q": 'punk "'}).json()["results"]
+    ]
+    assert titles == ["Punk night"]
+    assert api_client.get(url, {"q": "rock"}).json()["results"] == []
+    async_titles = [
+        e["title"]
+        for e in api_client.get(reverse("async-event-list"), {"q": "punk"}).json()[
+            "results"
+        ]
+    ]
+    assert async_titles == ["Punk night"]
+
+
+@pytest.mark.django_db
+def test_event_availability_view(
+    api_client,
+    django_assert_num_queries,
+    create_user,
+    create_event,
+    create_open_event,
+):
+    book_tickets(create_user, create_open_event, 2)
+    with django_assert_num_queries(1):
+        response = api_client.get(reverse("event-availability"))
+    assert response.status_code == 200
+    [event] = response.json()["results"]
+    assert event["id"] == create_open_event.id
+    assert (event["remaining_seats"], event["sold_out"]) == (1, False)
+
+    Event.objects.filter(pk=create_open_event.pk).update(booked_seats=3)
+    [event] = api_client.get(reverse("event-availability")).json()["results"]
+    assert (event["remaining_seats"], event["sold_out"]) == (0, True)
+
+
+@pytest.mark.django_db
+def test_sparse_fieldsets(
+    api_client, django_assert_max_num_queries, create_user, create_open_event
+):
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.get(reverse("event-list"), {"fields": "title"})
+    assert response.json()["results"] == [
+        {"id": create_open_event.id, "title": "Open Event"}
+    ]
+    assert not any('"description"' in query["sql"] for query in queries)
+
+    response = api_client.get(
+        reverse("event-detail", kwargs={"pk": create_open_event.id}),
+        {"omit": "description,location"},
+    )
+    assert "description" not in response.json() and "title" in response.json()
+    response = api_client.get(reverse("event-list"), {"fields": "nope"})
+    assert response.status_code == 400
+
+    Ticket.objects.create(user=create_user, event=create_open_event)
+    token = RefreshToken.for_user(create_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    for name in ["ticket-list", "async-ticket-list"]:
+        with django_assert_max_num_queries(3):
+            response = api_client.get(reverse(name), {"fields": "title,start_time"})
+        [ticket] = response.json()["results"]
+        assert set(ticket["event"]) == {"id", "title", "start_time"}
+
+
+@pytest.mark.django_db
+def test_large_responses_are_compressed(settings, api_client, create_open_event):
+    settings.COMPRESSION_MIN_SIZE = 100
+    url = reverse("event-list")
+    response = api_client.get(url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+    assert response["Content-Encoding"] == "gzip"
+    assert response["ETag"].startswith('W/"')
+    data = json.loads(gzip.decompress(response.content))
+    assert data["results"][0]["id"] == create_open_event.id
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+    assert response.status_code == 304
+
+    response = api_client.get(url, HTTP_ACCEPT_ENCODING="gzip, br")
+    assert response["Content-Encoding"] == "br"
+    assert json.loads(brotli.decompress(response.content)) == data
+
+    response = api_client.get(url, HTTP_ACCEPT_ENCODING="gzip;q=0")
+    assert not response.has_header("Content-Encoding")
+    assert api_client.get(url, {"fields": "id"}).get("Content-Encoding") is None
+
+
+@pytest.mark.django_db
+def test_attendee_export(api_client, create_user, create_admin, create_open_event):
+    tickets = [
+        Ticket.objects.create(user=create_user, event=create_open_event, quantity=n)
+        for n in [1, 2, 1]
+    ]
+    csv_url = reverse("event-attendees-csv", kwargs={"pk": create_open_event.id})
+    ndjson_url = reverse("event-attendees-ndjson", kwargs={"pk": create_open_event.id})
+    token = RefreshToken.for_user(create_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    assert api_client.get(csv_url).status_code == 403
+
+    token = RefreshToken.for_user(create_admin)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    response = api_client.get(csv_url)
+    assert response["Content-Type"] == "text/csv"
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    assert lines[0] == "ticket,user,username,quantity,booking_time"
+    assert [line.split(",")[0] for line in lines[1:]] == [
+        str(ticket.id) for ticket in tickets
+    ]
+
+    response = api_client.get(ndjson_url)
+    rows = [
+        json.loads(line) for line in b"".join(response.streaming_content).splitlines()
+    ]
+    assert rows[1]["username"] == "testuser" and rows[1]["quantity"] == 2
+
+    # Resume after the second row
+    response = api_client.get(
+        ndjson_url,
+        {"after_booking_time": rows[1]["booking_time"], "after_id": rows[1]["ticket"]},
+    )
+    rows = [
+        json.loads(line) for line in b"".join(response.streaming_content).splitlines()
+    ]
+    assert [row["ticket"] for row in rows] == [tickets[2].id]
+    assert api_client.get(ndjson_url, {"after_id": 1}).status_code == 400
+
+
+EVENT_CSV = (
+    "event_type,title,description,location,start_time,end_time,max_seats,"
+    "max_tickets_per_user,ticket_cost,booking_start,booking_end\n"
+    "online,Imported,Imported event,Virtual,2030-07-02T00:00Z,2030-07-02T02:00Z,"
+    "100,2,20.00,2030-06-20T00:00Z,2030-06-30T00:00Z\n"
+    "online,Late window,Imported event,Virtual,2030-07-02T00:00Z,2030-07-02T02:00Z,"
+    "100,,20.00,2030-06-20T00:00Z,2030-07-03T00:00Z\n"
+    "offline,No seats,Imported event,Hall,2030-07-02T00:00Z,2030-07-02T02:00Z,"
+    "0,2,20.00,2030-06-20T00:00Z,2030-06-30T00:00Z\n"
+)
+
+
+@pytest.mark.django_db
+def test_event_import_view(
+    api_client, django_capture_on_commit_callbacks, create_admin
+):
+    token = RefreshToken.for_user(create_admin)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.post(
+            reverse("event-import"), EVENT_CSV, content_type="text/csv"
+        )
+        results = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+    assert results[0] == {
+        "row": 2,
+        "errors": {"booking_end": ["Booking must end before the event starts."]},
+    }
+    assert list(results[1]["errors"]) == ["max_seats"]
+    assert results[2] == {"processed": 3, "created": 1}
+    event = Event.objects.get()
+    assert (event.title, event.created_by) == ("Imported", create_admin)
+    assert EventStats.objects.filter(event=event).exists()
+
+    response = api_client.post(reverse("event-import"), "{}", content_type="text/plain")
+    assert response.status_code == 415
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "content_type, body",
+    [
+        ("application/x-ndjson", b'\xff\xfe\n{"title": "\xff"}\n'),
+        # The second row is over the csv module's field size limit
+        ("text/csv", b"title,max_seats\n\xff\xfe,1\n" + b"x" * 200000 + b",1\n"),
+    ],
+)
+def test_event_import_view_reports_unreadable_rows(
+    api_client, create_admin, content_type, body
+):
+    token = RefreshToken.for_user(create_admin)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    response = api_client.post(reverse("event-import"), body, content_type=content_type)
+    results = [
+        json.loads(line) for line in b"".join(response.streaming_content).splitlines()
+    ]
+    assert [result["row"] for result in results[:-1]] == [1, 2]
+    assert results[0]["errors"] == {"non_field_errors": ["The row is not valid UTF-8."]}
+    assert list(results[1]["errors"]) == ["non_field_errors"]
+    assert results[-1] == {"processed": 2, "created": 0}
+
+
+@pytest.mark.django_db
+def test_import_events_command(tmp_path, create_admin):
+    rows = [
+        dict(zip(EVENT_CSV.splitlines()[0].split(","), line.split(",")))
+        for line in EVENT_CSV.splitlines()[1:]
+    ]
+    path = tmp_path / "events.ndjson"
+    path.write_text("\n".join(json.dumps(row) for row in rows[:1] * 3) + "\nnot json\n")
+    out = io.StringIO()
+    call_command(
+        "import_events",
+        str(path),
+        "--created-by=testadmin",
+        "--batch-size=2",
+        stdout=out,
+        stderr=io.StringIO(),
+    )
+    assert json.loads(out.getvalue())["row"] == 4
+    assert Event.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(
+    settings, tmp_path, api_client, create_user, create_open_event
+):
+    settings.METRICS_DIR = str(tmp_path)
+    metrics.reset()
+    token = RefreshToken.for_user(create_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+    url = reverse("ticket-create")
+    api_client.post(url, {"event": create_open_event.id, "quantity": 2})
+    api_client.post(url, {"event": create_open_event.id, "quantity": 2})
+    api_client.get(reverse("event-list"))
+
+    # Another worker's snapshot is added to this one's
+    (tmp_path / "1-1.json").write_text(
+        json.dumps(
+            {
+                "booking_outcomes_total": {
+                    "kind": "counter",
+                    "documentation": "",
+                    "labelnames": ["kind", "outcome"],
+                    "values": [[["ticket", "success"], 5]],
+                }
+            }
+        )
+    )
+    text = api_client.get(reverse("metrics")).content.decode()
+    lines = set(text.splitlines())
+    assert 'booking_outcomes_total{kind="ticket",outcome="success"} 6' in lines
+    assert 'booking_outcomes_total{kind="ticket",outcome="sold_out"} 1' in lines
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="events/",status="200"} 1'
+        in lines
+    )
+    assert (
+        'http_request_db_queries_count{method="POST",route="events/tickets/create/"} 2'
+        in lines
+    )
+
+    settings.METRICS_TOKEN = "secret"
+    assert api_client.get(reverse("metrics")).status_code == 403
+
+
+@pytest.mark.django_db
+def test_query_metrics_keep_execute_wrapper_blocks(api_client, create_event):
+    def record(execute, sql, params, many, context):
+        return execute(sql, params, many, context)
+
+    if _record_query in connection.execute_wrappers:
+        connection.execute_wrappers.remove(_record_query)
+    # The request instruments the connection inside the block
+    with connection.execute_wrapper(record):
+        assert api_client.get(reverse("event-list")).status_code == 200
+    assert connection.execute_wrappers == [_record_query]
@@ -1,18 +1,64 @@
 from django.urls import path
+from .async_views import (
+    AsyncEventListView,
+    AsyncEventDetailView,
+    AsyncEventSummaryView,
+    AsyncTicketListView,
+)
 from .views import (
     EventListView,
+    EventAvailabilityView,
+    EventDetailView,
     EventCreateView,
+    EventImportView,
     EventUpdateView,
     TicketCreateView,
+    CartBookingView,
+    BookingClaimView,
+    SeatHoldCreateView,
+    SeatHoldConfirmView,
     TicketListView,
     EventSummaryView,
+    EventSummaryListView,
+    EventAttendeeExportView,
 )
 
 urlpatterns = [
     path("", EventListView.as_view(), name="event-list"),
+    path("available/", EventAvailabilityView.as_view(), name="event-availability"),
     path("create/", EventCreateView.as_view(), name="event-create"),
+    path("import/", EventImportView.as_view(), name="event-import"),
+    path("<int:pk>/", EventDetailView.as_view(), name="event-detail"),
     path("<int:pk>/update/", EventUpdateView.as_view(), name="event-update"),
     path("<int:pk>/summary/", EventSummaryView.as_view(), name="event-summary"),
+    path(
+        "<int:pk>/attendees/csv/",
+        EventAttendeeExportView.as_view(export_format="csv"),
+        name="event-attendees-csv",
+    ),
+    path(
+        "<int:pk>/attendees/ndjson/",
+        EventAttendeeExportView.as_view(export_format="ndjson"),
+        name="event-attendees-ndjson",
+    ),
+    path("summaries/", EventSummaryListView.as_view(), name="event-summary-list"),
     path("tickets/create/", TicketCreateView.as_view(), name="ticket-create"),
+    path("tickets/cart/", CartBookingView.as_view(), name="ticket-cart"),
+    path("tickets/claims/<int:pk>/", BookingClaimView.as_view(), name="booking-claim"),
+    path("tickets/holds/", SeatHoldCreateView.as_view(), name="seat-hold-create"),
+    path(
+        "tickets/holds/<int:pk>/confirm/",
+        SeatHoldConfirmView.as_view(),
+        name="seat-hold-confirm",
+    ),
     path("tickets/", TicketListView.as_view(), name="ticket-list"),
+    # Async versions of the read endpoints, for deployments served over ASGI
+    path("async/", AsyncEventListView.as_view(), name="async-event-list"),
+    path("async/<int:pk>/", AsyncEventDetailView.as_view(), name="async-event-detail"),
+    path(
+        "async/<int:pk>/summary/",
+        AsyncEventSummaryView.as_view(),
+        name="async-event-summary",
+    ),
+    path("async/tickets/", AsyncTicketListView.as_view(), name="async-ticket-list"),
 ]
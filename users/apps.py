@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db import transaction
+from django.db.models.signals import post_delete
+
+
+def revoke_deleted_user(sender, instance, **kwargs):
+    from .authentication import revoke_user_tokens
+
+    # Tokens of a deleted user would otherwise keep authorizing requests
+    # from their claims until they expire
+    pk = instance.pk
+    transaction.on_commit(lambda: revoke_user_tokens(pk))
 
 
 class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "users"
+
+    def ready(self):
+        from . import checks, schema  # noqa: F401
+
+        post_delete.connect(revoke_deleted_user, sender="users.CustomUser")
@@ -0,0 +1,77 @@
+import uuid
+
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+ROLE_CLAIMS = ("user_type", "is_active")
+# The user's revocation current when the token was issued
+VERSION_CLAIM = "token_version"
+
+
+class UserRefreshToken(RefreshToken):
+    # Carries the claims ClaimsJWTAuthentication needs to authorize requests
+    # without loading the user. Access tokens created from it copy them.
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token["user_type"] = user.user_type
+        token["is_active"] = user.is_active
+        token[VERSION_CLAIM] = cache.get(revocation_key(user.pk))
+        return token
+
+
+class ClaimsUser(TokenUser):
+    @cached_property
+    def user_type(self):
+        return self.token["user_type"]
+
+    @cached_property
+    def is_active(self):
+        return self.token["is_active"]
+
+
+def revocation_key(user_id):
+    return f"auth:revoked:{user_id}"
+
+
+# Rejects every token issued to the user so far, by giving the user a new
+# revocation that only tokens issued from now on carry. Saving a user with a
+# changed role or active flag calls it. The revocation lives in the cache, so with
+# the default process local cache only the worker that recorded it knows of
+# it, set CACHE_URL to a shared cache when running several workers.
+def revoke_user_tokens(user_id):
+    timeout = api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+    cache.set(revocation_key(user_id), uuid.uuid4().hex, timeout=timeout)
+
+
+def is_revoked(validated_token):
+    # Compared by identity rather than issue time, which only has whole
+    # seconds, so tokens issued right after a revocation stay valid. Once the
+    # revocation expires every token issued before it has expired too.
+    revocation = cache.get(revocation_key(validated_token[api_settings.USER_ID_CLAIM]))
+    return revocation is not None and validated_token.get(VERSION_CLAIM) != revocation
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    # Builds request.user from the token's role claims instead of querying
+    # the user table. Tokens issued without those claims fall back to a full
+    # user load.
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        if is_revoked(validated_token):
+            raise AuthenticationFailed(
+                _("Token has been revoked"), code="token_revoked"
+            )
+        if not all(claim in validated_token for claim in ROLE_CLAIMS):
+            return super().get_user(validated_token)
+        if not validated_token["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return ClaimsUser(validated_token)
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_revocation_cache(app_configs, **kwargs):
+    # Token revocations are stored in the default cache, see
+    # users.authentication.revoke_user_tokens
+    if not settings.CACHES["default"]["BACKEND"].endswith("LocMemCache"):
+        return []
+    return [
+        Warning(
+            "Token revocations are only seen by the worker process that "
+            "recorded them, the default cache is process local.",
+            hint="Set CACHE_URL to a cache shared by all workers, e.g. redis.",
+            id="users.W001",
+        )
+    ]
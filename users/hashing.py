@@ -0,0 +1,48 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+from utils import metrics
+
+# Password hashing is CPU bound and deliberately slow, it runs on a small
+# dedicated pool so a burst of logins can't take every worker with it.
+_executor = ThreadPoolExecutor(
+    max_workers=settings.LOGIN_HASHER_THREADS, thread_name_prefix="password-hasher"
+)
+_lock = threading.Lock()
+_queue_depth = 0
+
+QUEUE_DEPTH = metrics.gauge(
+    "login_hasher_queue_depth", "Password checks waiting for or on the hasher pool."
+)
+REJECTED = metrics.counter(
+    "login_hasher_rejected_total", "Logins turned away because the queue was full."
+)
+
+
+class HasherBusy(Exception):
+    pass
+
+
+async def check_password(user, raw_password):
+    global _queue_depth
+    with _lock:
+        if _queue_depth >= settings.LOGIN_HASHER_MAX_QUEUE:
+            REJECTED.inc()
+            raise HasherBusy
+        _queue_depth += 1
+        QUEUE_DEPTH.set(_queue_depth)
+    try:
+        loop = asyncio.get_running_loop()
+        if user is None:
+            # Hash anyway so unknown usernames take as long as wrong passwords
+            await loop.run_in_executor(_executor, make_password, raw_password)
+            return False
+        return await loop.run_in_executor(_executor, user.check_password, raw_password)
+    finally:
+        with _lock:
+            _queue_depth -= 1
+            QUEUE_DEPTH.set(_queue_depth)
@@ -0,0 +1,39 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand
+
+from users.provisioning import process_pool, provision_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users from a CSV file with username and password columns. "
+        "Rejected rows are written to stdout as JSON lines."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--user-type", choices=["user", "admin"], default="user")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--processes", type=int, default=None)
+
+    def handle(self, *args, **options):
+        with open(options["path"], newline="") as file, process_pool(
+            options["processes"]
+        ) as pool:
+            created = 0
+            for result in provision_users(
+                csv.DictReader(file),
+                options["user_type"],
+                options["batch_size"],
+                pool,
+            ):
+                if "row" in result:
+                    self.stdout.write(json.dumps(result))
+                else:
+                    created = result["created"]
+                    self.stderr.write(
+                        f"Processed {result['processed']} rows, created {created} users."
+                    )
+        self.stderr.write(self.style.SUCCESS(f"Created {created} users."))
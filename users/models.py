@@ -1,5 +1,5 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 
 
 class CustomUser(AbstractUser):
@@ -7,7 +7,39 @@ class CustomUser(AbstractUser):
         ("user", "User"),
         ("admin", "Admin"),
     )
+    # Copied into tokens, see users.authentication.UserRefreshToken
+    ROLE_FIELDS = ("user_type", "is_active")
 
     user_type = models.CharField(
         max_length=5, choices=USER_TYPE_CHOICES, default="user"
     )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        user._loaded_roles = user.get_roles()
+        return user
+
+    def get_roles(self):
+        # Deferred fields are left out instead of being loaded
+        return {
+            name: self.__dict__[name]
+            for name in self.ROLE_FIELDS
+            if name in self.__dict__
+        }
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Tokens issued so far carry the old roles and stop being accepted
+        # once the change is committed. QuerySet.update() doesn't get here,
+        # call revoke_user_tokens() after changing roles that way.
+        loaded = getattr(self, "_loaded_roles", None)
+        roles = self.get_roles()
+        if loaded is not None and any(
+            loaded[name] != roles[name] for name in loaded.keys() & roles.keys()
+        ):
+            from .authentication import revoke_user_tokens
+
+            pk = self.pk
+            transaction.on_commit(lambda: revoke_user_tokens(pk))
+        self._loaded_roles = roles
@@ -0,0 +1,122 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+
+User = get_user_model()
+
+
+class UserRowSerializer(serializers.Serializer):
+    # Field rules of UserCreateSerializer without its per-row uniqueness
+    # query, usernames are checked against the database a batch at a time
+    username = serializers.CharField(
+        max_length=150, validators=[UnicodeUsernameValidator()]
+    )
+    password = serializers.CharField()
+
+
+# Hashes the passwords of registrations made over HTTP. It is shared by all
+# requests of a web worker, which mustn't fork process pools of its own.
+# PBKDF2 releases the GIL, so the threads hash in parallel.
+_thread_pool = ThreadPoolExecutor(
+    max_workers=settings.USER_IMPORT_THREADS, thread_name_prefix="user-import-hasher"
+)
+
+
+def _init_worker():
+    # Worker processes that weren't forked need the settings for the hashers
+    django.setup()
+
+
+def process_pool(processes=None):
+    # A pool for imports outside of the web server, see import_users
+    processes = processes or settings.USER_IMPORT_PROCESSES or os.cpu_count()
+    return ProcessPoolExecutor(processes, initializer=_init_worker)
+
+
+# Creates users from an iterable of {"username", "password"} rows and yields
+# a result for every rejected row, plus a progress report after every batch.
+# Passwords are hashed on the given pool, the shared thread pool by default,
+# and each batch is inserted with one bulk_create, so the input is never
+# held in memory as a whole.
+def provision_users(rows, user_type="user", batch_size=1000, pool=None):
+    pool = pool or _thread_pool
+    seen = set()
+    created = processed = 0
+    rows = enumerate(rows, 1)
+    while batch := list(islice(rows, batch_size)):
+        valid = {}
+        for number, row in batch:
+            serializer = UserRowSerializer(data=row)
+            if not serializer.is_valid():
+                yield {"row": number, "errors": serializer.errors}
+                continue
+            username = serializer.validated_data["username"]
+            if username in seen:
+                yield _duplicate(number, username)
+                continue
+            seen.add(username)
+            valid[username] = (number, serializer.validated_data["password"])
+
+        # Usernames that are taken already aren't worth hashing for
+        for username in _existing(valid):
+            yield _duplicate(valid.pop(username)[0], username)
+
+        passwords = pool.map(
+            make_password,
+            [password for _, password in valid.values()],
+            chunksize=16,
+        )
+        users = [
+            User(username=username, password=password, user_type=user_type)
+            for username, password in zip(valid, passwords)
+        ]
+        taken = _insert(users)
+        for username in taken:
+            yield _duplicate(valid[username][0], username)
+
+        created += len(users) - len(taken)
+        processed += len(batch)
+        yield {"processed": processed, "created": created}
+
+
+def _duplicate(number, username):
+    return {
+        "row": number,
+        "username": username,
+        "errors": {"username": ["A user with that username already exists."]},
+    }
+
+
+def _existing(usernames):
+    return set(
+        User.objects.filter(username__in=list(usernames)).values_list(
+            "username", flat=True
+        )
+    )
+
+
+# Inserts the users and returns the usernames that were registered by
+# someone else in the meantime
+def _insert(users):
+    taken = set()
+    while True:
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(
+                    [user for user in users if user.username not in taken]
+                )
+            return taken
+        except IntegrityError:
+            clashes = _existing(user.username for user in users)
+            if clashes <= taken:
+                # Not a username clash, retrying can't help
+                raise
+            taken = clashes
@@ -1,6 +1,10 @@
 from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+
+from .authentication import UserRefreshToken, is_revoked
 
 User = get_user_model()
 
@@ -12,11 +16,8 @@ class UserCreateSerializer(serializers.ModelSerializer):
         extra_kwargs = {"password": {"write_only": True}}
 
     def create(self, validated_data):
-        validated_data["user_type"] = "user"
-        user = super().create(validated_data)
-        user.set_password(validated_data["password"])
-        user.save()
-        return user
+        # Hash the password before the insert instead of saving twice
+        return User.objects.create_user(**validated_data, user_type="user")
 
 
 class AdminCreateSerializer(serializers.ModelSerializer):
@@ -26,11 +27,14 @@ class AdminCreateSerializer(serializers.ModelSerializer):
         extra_kwargs = {"password": {"write_only": True}}
 
     def create(self, validated_data):
-        validated_data["user_type"] = "admin"
-        user = super().create(validated_data)
-        user.set_password(validated_data["password"])
-        user.save()
-        return user
+        return User.objects.create_user(**validated_data, user_type="admin")
+
+
+class BulkUserCreateSerializer(serializers.Serializer):
+    user_type = serializers.ChoiceField(choices=User.USER_TYPE_CHOICES, default="user")
+    # Rows are validated one by one while importing, so a bad row doesn't
+    # reject the whole import
+    users = serializers.ListField(child=serializers.DictField(), allow_empty=False)
 
 
 class UserLoginSerializer(serializers.Serializer):
@@ -40,10 +44,24 @@ class UserLoginSerializer(serializers.Serializer):
     def validate(self, attrs):
         user = User.objects.filter(username=attrs["username"]).first()
         if user and user.check_password(attrs["password"]):
-            refresh = RefreshToken.for_user(user)
-            return {
-                "refresh": str(refresh),
-                "access": str(refresh.access_token),
-                "user_type": user.user_type,
-            }
+            return issue_tokens(user)
         raise serializers.ValidationError("Incorrect username or password.")
+
+
+def issue_tokens(user):
+    refresh = UserRefreshToken.for_user(user)
+    return {
+        "refresh": str(refresh),
+        "access": str(refresh.access_token),
+        "user_type": user.user_type,
+    }
+
+
+class UserTokenRefreshSerializer(TokenRefreshSerializer):
+    # Access tokens copy the role claims of the refresh token, so a revoked
+    # refresh token must not hand out new ones
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        if is_revoked(self.token_class(attrs["refresh"])):
+            raise InvalidToken(_("Token has been revoked"))
+        return data
@@ -1,7 +1,24 @@
+import json
+from io import StringIO
+from unittest import mock
+
 import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from rest_framework.test import APIClient
+from drf_spectacular.generators import SchemaGenerator
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import (
+    ClaimsJWTAuthentication,
+    UserRefreshToken,
+    revoke_user_tokens,
+)
+from .provisioning import _insert
 
 User = get_user_model()
 
@@ -11,6 +28,11 @@ def api_client():
     return APIClient()
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
 @pytest.mark.django_db
 def test_user_create_view(api_client):
     user_data = {
@@ -48,3 +70,162 @@ def test_user_login_view(api_client):
         reverse("login"), {"username": "testuser", "password": "testpassword"}
     )
     assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_login_token_carries_role_claims(api_client):
+    User.objects.create_user(
+        username="testadmin", password="testpassword", user_type="admin"
+    )
+    response = api_client.post(
+        reverse("login"), {"username": "testadmin", "password": "testpassword"}
+    )
+    token = AccessToken(response.json()["access"])
+    assert token["user_type"] == "admin"
+    assert token["is_active"] is True
+
+
+@pytest.mark.django_db
+def test_claims_authentication_skips_user_lookup(django_assert_num_queries):
+    user = User.objects.create_user(username="testuser", password="testpassword")
+    token = UserRefreshToken.for_user(user).access_token
+    request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    with django_assert_num_queries(0):
+        request_user, _ = ClaimsJWTAuthentication().authenticate(request)
+    assert request_user.pk == user.pk
+    assert request_user.user_type == "user"
+
+    revoke_user_tokens(user.pk)
+    with pytest.raises(AuthenticationFailed):
+        ClaimsJWTAuthentication().authenticate(request)
+
+    # Issued within the same second as the revocation
+    token = UserRefreshToken.for_user(user).access_token
+    request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+    assert ClaimsJWTAuthentication().authenticate(request)[0].pk == user.pk
+
+
+def test_claims_authentication_is_documented():
+    schema = SchemaGenerator().get_schema(request=None, public=True)
+    assert "jwtAuth" in schema["components"]["securitySchemes"]
+    operation = schema["paths"]["/events/create/"]["post"]
+    assert {"jwtAuth": []} in operation["security"]
+
+
+@pytest.mark.django_db
+def test_role_changes_revoke_tokens(api_client, django_capture_on_commit_callbacks):
+    user = User.objects.create_user(username="testuser", password="testpassword")
+    refresh = UserRefreshToken.for_user(user)
+    request = APIRequestFactory().get(
+        "/", HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}"
+    )
+
+    user = User.objects.get(pk=user.pk)
+    with django_capture_on_commit_callbacks(execute=True):
+        user.first_name = "Test"
+        user.save()
+    assert ClaimsJWTAuthentication().authenticate(request)[0].pk == user.pk
+
+    with django_capture_on_commit_callbacks(execute=True):
+        user.user_type = "admin"
+        user.save()
+    with pytest.raises(AuthenticationFailed):
+        ClaimsJWTAuthentication().authenticate(request)
+    # Refreshing would hand out the old claims again
+    response = api_client.post(reverse("token-refresh"), {"refresh": str(refresh)})
+    assert response.status_code == 401
+
+
+@pytest.mark.django_db
+def test_deleting_a_user_revokes_tokens(django_capture_on_commit_callbacks):
+    user = User.objects.create_user(username="testuser", password="testpassword")
+    token = UserRefreshToken.for_user(user).access_token
+    request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        user.delete()
+    with pytest.raises(AuthenticationFailed):
+        ClaimsJWTAuthentication().authenticate(request)
+
+
+@pytest.mark.django_db
+def test_async_login_and_token_refresh(api_client):
+    User.objects.create_user(username="testuser", password="testpassword")
+    response = api_client.post(
+        reverse("login-async"),
+        {"username": "testuser", "password": "wrongpassword"},
+        format="json",
+    )
+    assert response.status_code == 400
+
+    response = api_client.post(
+        reverse("login-async"),
+        {"username": "testuser", "password": "testpassword"},
+        format="json",
+    )
+    assert response.status_code == 200
+    assert response.json()["user_type"] == "user"
+
+    response = api_client.post(
+        reverse("token-refresh"), {"refresh": response.json()["refresh"]}
+    )
+    assert response.status_code == 200
+    assert AccessToken(response.json()["access"])["user_type"] == "user"
+
+
+@pytest.mark.django_db
+def test_bulk_user_create_streams_row_errors(api_client):
+    User.objects.create_user(username="taken", password="password")
+    admin = User.objects.create_user(
+        username="admin", password="password", user_type="admin"
+    )
+    api_client.force_authenticate(admin)
+    response = api_client.post(
+        reverse("bulk-register"),
+        {
+            "users": [
+                {"username": "first", "password": "password1"},
+                {"username": "taken", "password": "password2"},
+                {"username": "first", "password": "password3"},
+                {"username": "bad name!", "password": "password4"},
+                {"username": "second", "password": "password5"},
+            ]
+        },
+        format="json",
+    )
+    assert response.status_code == 200
+    results = [
+        json.loads(line) for line in b"".join(response.streaming_content).splitlines()
+    ]
+    assert [result.get("row") for result in results] == [3, 4, 2, None]
+    assert results[-1] == {"processed": 5, "created": 2}
+    assert User.objects.get(username="first").check_password("password1")
+    assert User.objects.get(username="second").user_type == "user"
+
+
+@pytest.mark.django_db
+def test_import_users_command(tmp_path):
+    path = tmp_path / "users.csv"
+    path.write_text("username,password\nalice,secret1\nbob,secret2\nalice,secret3\n")
+    out = StringIO()
+    call_command(
+        "import_users",
+        str(path),
+        "--batch-size=2",
+        "--processes=1",
+        stdout=out,
+        stderr=StringIO(),
+    )
+    assert json.loads(out.getvalue())["row"] == 3
+    assert set(User.objects.values_list("username", flat=True)) == {"alice", "bob"}
+
+
+@pytest.mark.django_db
+def test_bulk_insert_gives_up_on_other_integrity_errors():
+    users = [User(username="newuser")]
+    with mock.patch.object(
+        type(User.objects), "bulk_create", side_effect=IntegrityError
+    ):
+        with pytest.raises(IntegrityError):
+            _insert(users)
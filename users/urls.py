@@ -1,8 +1,18 @@
 from django.urls import path
-from .views import UserCreateView, AdminCreateView, UserLoginView
+from rest_framework_simplejwt.views import TokenRefreshView
+from .views import (
+    UserCreateView,
+    AdminCreateView,
+    BulkUserCreateView,
+    UserLoginView,
+    async_login_view,
+)
 
 urlpatterns = [
     path("register/", UserCreateView.as_view(), name="register"),
     path("register/admin/", AdminCreateView.as_view(), name="admin-register"),
+    path("register/bulk/", BulkUserCreateView.as_view(), name="bulk-register"),
     path("login/", UserLoginView.as_view(), name="login"),
+    path("login/async/", async_login_view, name="login-async"),
+    path("token/refresh/", TokenRefreshView.as_view(), name="token-refresh"),
 ]
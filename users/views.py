@@ -1,9 +1,20 @@
+import json
+
 from django.contrib.auth import get_user_model
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+from utils.permissions import IsAdminOrReadOnly
+from . import hashing
+from .authentication import ClaimsJWTAuthentication
+from .provisioning import provision_users
 from .serializers import (
     UserCreateSerializer,
     AdminCreateSerializer,
+    BulkUserCreateSerializer,
     UserLoginSerializer,
+    issue_tokens,
 )
 from rest_framework.response import Response
 from rest_framework import status
@@ -48,6 +59,42 @@ class AdminCreateView(generics.CreateAPIView):
     serializer_class = AdminCreateSerializer
 
 
+@extend_schema(
+    description=(
+        "Create many users at once. The response streams one JSON line per "
+        "rejected row and a progress line after every batch."
+    ),
+    examples=[
+        OpenApiExample(
+            "Bulk User Creation Example",
+            value={
+                "user_type": "user",
+                "users": [
+                    {"username": "firstuser", "password": "firstpassword"},
+                    {"username": "seconduser", "password": "secondpassword"},
+                ],
+            },
+        ),
+    ],
+)
+class BulkUserCreateView(generics.GenericAPIView):
+    permission_classes = [IsAdminOrReadOnly]
+    authentication_classes = [ClaimsJWTAuthentication]
+    serializer_class = BulkUserCreateSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = provision_users(
+            serializer.validated_data["users"],
+            serializer.validated_data["user_type"],
+        )
+        return StreamingHttpResponse(
+            (json.dumps(result) + "\n" for result in results),
+            content_type="application/x-ndjson",
+        )
+
+
 @extend_schema(
     description="Login for both admin and normal users.",
     examples=[
@@ -62,8 +109,50 @@ class AdminCreateView(generics.CreateAPIView):
 )
 class UserLoginView(generics.CreateAPIView):
     serializer_class = UserLoginSerializer
+    query_budget = 1
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
+
+# Same contract as UserLoginView, but the password check runs on the bounded
+# hasher pool so waiting logins don't hold a worker. Once too many checks
+# are queued new logins get a 503 to retry later.
+async def async_login_view(request):
+    if request.method != "POST":
+        return JsonResponse(
+            {"detail": f'Method "{request.method}" not allowed.'}, status=405
+        )
+
+    try:
+        if request.content_type == "application/json":
+            data = json.loads(request.body or b"{}")
+        else:
+            data = request.POST
+        attrs = UserLoginSerializer().to_internal_value(data)
+    except ValueError:
+        return JsonResponse({"detail": "JSON parse error."}, status=400)
+    except ValidationError as exc:
+        return JsonResponse(exc.detail, status=400)
+
+    user = await User.objects.filter(username=attrs["username"]).afirst()
+    try:
+        valid = await hashing.check_password(user, attrs["password"])
+    except hashing.HasherBusy:
+        return JsonResponse(
+            {"detail": "Too many logins in progress, try again shortly."},
+            status=503,
+            headers={"Retry-After": "1"},
+        )
+    if not valid:
+        return JsonResponse(
+            {api_settings.NON_FIELD_ERRORS_KEY: ["Incorrect username or password."]},
+            status=400,
+        )
+    return JsonResponse(issue_tokens(user))
+
+
+# Clients authenticate with tokens, not cookies
+async_login_view.csrf_exempt = True
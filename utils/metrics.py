@@ -0,0 +1,227 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Process local metrics in the Prometheus text format. Every process writes
+# a snapshot of its metrics to METRICS_DIR every METRICS_FLUSH_INTERVAL
+# seconds and the metrics endpoint adds up the snapshots of all processes,
+# so any worker can answer for the whole server. Counters and histograms of
+# processes that have exited keep counting, gauges only count while their
+# process keeps flushing.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_lock = threading.Lock()
+_registry = {}
+_flusher_pid = None
+# Tells snapshots of a reused pid apart
+_process_id = f"{os.getpid()}-{time.time_ns()}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        return {
+            "kind": self.kind,
+            "documentation": self.documentation,
+            "labelnames": self.labelnames,
+            "values": [[list(key), value] for key, value in self.values.items()],
+        }
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with _lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        # Counts per bucket, the last one for +Inf, followed by the sum
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0]
+            state[index] += 1
+            state[-1] += value
+
+    def snapshot(self):
+        return {**super().snapshot(), "buckets": self.buckets}
+
+
+def _register(cls, name, *args, **kwargs):
+    with _lock:
+        if name not in _registry:
+            _registry[name] = cls(name, *args, **kwargs)
+        return _registry[name]
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter, name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    return _register(Gauge, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+def reset():
+    # Forgets the values recorded by this process so far
+    with _lock:
+        for metric in _registry.values():
+            metric.values.clear()
+
+
+def metrics_dir():
+    path = Path(settings.METRICS_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def flush():
+    with _lock:
+        snapshot = {name: metric.snapshot() for name, metric in _registry.items()}
+    path = metrics_dir() / f"{_process_id}.json"
+    temporary = path.with_suffix(".tmp")
+    temporary.write_text(json.dumps(snapshot))
+    os.replace(temporary, path)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def start_flushing():
+    # Starts the flusher of this process. Forked workers don't inherit the
+    # thread, so they get their own on first use.
+    global _flusher_pid, _process_id
+    if _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        if _flusher_pid is not None:
+            # A forked child starts over instead of counting its parent's
+            # values a second time
+            _process_id = f"{os.getpid()}-{time.time_ns()}"
+            for metric in _registry.values():
+                metric.values.clear()
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_periodically, daemon=True).start()
+
+
+atexit.register(lambda: _flusher_pid == os.getpid() and flush())
+
+
+def collect():
+    # Adds up the snapshots of all processes
+    flush()
+    stale_before = time.time() - 3 * settings.METRICS_FLUSH_INTERVAL
+    merged = {}
+    for path in metrics_dir().glob("*.json"):
+        try:
+            snapshot = json.loads(path.read_text())
+            live = path.stat().st_mtime >= stale_before
+        except (OSError, ValueError):
+            continue
+        for name, metric in snapshot.items():
+            if metric["kind"] == "gauge" and not live:
+                continue
+            target = merged.setdefault(name, {**metric, "values": {}})
+            for key, value in metric["values"]:
+                key = tuple(key)
+                if metric["kind"] == "histogram":
+                    current = target["values"].get(key, [0] * len(value))
+                    value = [a + b for a, b in zip(current, value)]
+                else:
+                    value += target["values"].get(key, 0)
+                target["values"][key] = value
+    return merged
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def render(merged):
+    lines = []
+    for name, metric in sorted(merged.items()):
+        lines.append(f"# HELP {name} {metric['documentation']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        names = metric["labelnames"]
+        for key, value in sorted(metric["values"].items()):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_labels(names, key)} {value}")
+                continue
+            cumulative = 0
+            bounds = [str(bound) for bound in metric["buckets"]] + ["+Inf"]
+            for bound, count in zip(bounds, value):
+                cumulative += count
+                labels = _labels(names, key, ("le", bound))
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, key)} {value[-1]}")
+            lines.append(f"{name}_count{_labels(names, key)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render(collect()), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
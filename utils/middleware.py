@@ -0,0 +1,217 @@
+import logging
+import re
+import time
+from contextvars import ContextVar
+
+import brotli
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Compression is cheap next to the transfer of large payloads, but the
+# highest levels mostly cost CPU time
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+_encoding_re = re.compile(r"\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?")
+
+
+def accepted_encodings(header):
+    # Maps each encoding of an Accept-Encoding header to its quality
+    encodings = {}
+    for part in header.split(","):
+        match = _encoding_re.match(part)
+        if match:
+            try:
+                encodings[match[1].lower()] = float(match[2] or 1)
+            except ValueError:
+                continue
+    return encodings
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    # Compresses JSON and text responses of at least COMPRESSION_MIN_SIZE
+    # bytes with brotli when the client accepts it and with gzip otherwise.
+    # Streaming responses are passed through untouched so exports keep
+    # flowing row by row.
+    #
+    # Replaces GZipMiddleware, whose gzip output with random padding against
+    # BREACH is reused. Brotli has no such padding and goes without on
+    # purpose: BREACH needs a browser to send the victim's credentials along
+    # with attacker controlled input, and this API authenticates with bearer
+    # tokens that browsers never attach on their own.
+
+    def process_response(self, request, response):
+        if (
+            response.streaming
+            or response.has_header("Content-Encoding")
+            or len(response.content) < settings.COMPRESSION_MIN_SIZE
+            or not response.get("Content-Type", "").startswith(COMPRESSIBLE_TYPES)
+        ):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        accepted = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if accepted.get("br", 0) > 0:
+            encoding = "br"
+            content = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        elif accepted.get("gzip", 0) > 0:
+            encoding = "gzip"
+            content = compress_string(
+                response.content, max_random_bytes=GZipMiddleware.max_random_bytes
+            )
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response["Content-Length"] = str(len(content))
+        response["Content-Encoding"] = encoding
+        # The compressed body isn't byte-identical to what the ETag was
+        # computed for, like GZipMiddleware make it weak
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
+
+
+REQUEST_LATENCY = metrics.histogram(
+    "http_request_duration_seconds",
+    "Time spent handling requests, by route.",
+    ["method", "route", "status"],
+)
+REQUEST_QUERIES = metrics.histogram(
+    "http_request_db_queries",
+    "Database queries per request, by route.",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+REQUEST_DB_TIME = metrics.histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in database queries per request, by route.",
+    ["method", "route"],
+)
+RESPONSE_SIZE = metrics.histogram(
+    "http_response_size_bytes",
+    "Size of response bodies, by route. Streaming responses aren't counted.",
+    ["method", "route"],
+    buckets=tuple(4**power for power in range(4, 12)),
+)
+QUERY_BUDGET_EXCEEDED = metrics.counter(
+    "http_query_budget_exceeded_total",
+    "Requests that made more database queries than their view's query_budget.",
+    ["method", "route"],
+)
+
+# [queries, seconds] of the current request, shared with the threads its
+# ORM calls run in under async views
+_query_stats = ContextVar("query_stats", default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - started
+
+
+def _instrument(connection, **kwargs):
+    # Installed for good as the outermost wrapper. execute_wrapper() blocks
+    # pop the last wrapper on exit, which has to stay theirs.
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+connection_created.connect(_instrument)
+
+
+def query_budget(match):
+    # The query_budget of the view a request was routed to. Views declare
+    # the most queries a full response may take, whatever the size of the
+    # data, so a request over it points at a query per row.
+    if match is None:
+        return None
+    view = getattr(match.func, "view_class", match.func)
+    return getattr(view, "query_budget", None)
+
+
+class MetricsMiddleware:
+    # Records latency, query count, query time and response size of every
+    # request by route, see utils.metrics, and logs requests over the
+    # query_budget of their view
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+        self.finish(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats, token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+        self.finish(request, response, stats)
+        return response
+
+    def start(self):
+        metrics.start_flushing()
+        # Connections opened before the signal was connected, e.g. in tests
+        for connection in connections.all():
+            _instrument(connection)
+        stats = [0, 0.0, time.perf_counter()]
+        return stats, _query_stats.set(stats)
+
+    def finish(self, request, response, stats):
+        match = request.resolver_match
+        route = match.route if match else "unmatched"
+        method = request.method
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - stats[2],
+            method=method,
+            route=route,
+            status=response.status_code,
+        )
+        REQUEST_QUERIES.observe(stats[0], method=method, route=route)
+        budget = query_budget(match)
+        if budget is not None and stats[0] > budget:
+            QUERY_BUDGET_EXCEEDED.inc(method=method, route=route)
+            logger.warning(
+                "%s %s made %d database queries, its budget is %d",
+                method,
+                request.path,
+                stats[0],
+                budget,
+            )
+        REQUEST_DB_TIME.observe(stats[1], method=method, route=route)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(len(response.content), method=method, route=route)